@@ -0,0 +1,243 @@
+"""
+Alert Actions for Yisel Web
+Runs alert side effects (webhooks, email, logs) on background workers, one queue per destination
+"""
+
+import os
+import json
+import time
+import heapq
+import smtplib
+import itertools
+import threading
+from collections import deque
+from email.message import EmailMessage
+from urllib.parse import urlparse
+import requests
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from metrics import record_delivery
+
+# Dispatcher settings
+ALERT_ACTION_WORKERS = int(os.environ.get('ALERT_ACTION_WORKERS', '2'))
+ALERT_ACTION_MAX_RETRIES = int(os.environ.get('ALERT_ACTION_MAX_RETRIES', '3'))
+ALERT_ACTION_RETRY_BACKOFF = float(os.environ.get('ALERT_ACTION_RETRY_BACKOFF', '2'))
+ALERT_ACTION_QUEUE_LIMIT = int(os.environ.get('ALERT_ACTION_QUEUE_LIMIT', '1000'))
+ALERT_ACTION_TIMEOUT = float(os.environ.get('ALERT_ACTION_TIMEOUT', '10'))
+
+# Email action settings
+SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '25'))
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_FROM = os.environ.get('SMTP_FROM', 'yisel@localhost')
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '0') == '1'
+
+class WebhookAction:
+    """POSTs the event to action['url'] as JSON"""
+    
+    def __init__(self, session, timeout=ALERT_ACTION_TIMEOUT):
+        self.session = session
+        self.timeout = timeout
+    
+    def destination(self, action):
+        """Queue webhooks per host so one slow endpoint doesn't hold up the others"""
+        return f"webhook:{urlparse(action.get('url', '')).netloc}"
+    
+    def __call__(self, action, event_data):
+        url = action.get('url')
+        if not url:
+            return
+        response = self.session.post(url, json=event_data, timeout=self.timeout)
+        response.raise_for_status()
+
+class EmailAction:
+    """Sends the event by SMTP to action['to']"""
+    
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, username=SMTP_USERNAME, password=SMTP_PASSWORD,
+                 sender=SMTP_FROM, starttls=SMTP_STARTTLS, timeout=ALERT_ACTION_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.starttls = starttls
+        self.timeout = timeout
+    
+    def destination(self, action):
+        return f"smtp:{self.host}:{self.port}"
+    
+    def __call__(self, action, event_data):
+        recipients = action.get('to')
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        if not recipients:
+            return
+        
+        message = EmailMessage()
+        message['Subject'] = action.get('subject', 'Yisel Alert')
+        message['From'] = self.sender
+        message['To'] = ', '.join(recipients)
+        message.set_content(f"{action.get('message', 'Alert triggered')}\n\n{json.dumps(event_data, indent=2, default=str)}")
+        
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+class LogAction:
+    """Prints the alert"""
+    
+    def destination(self, action):
+        return 'log'
+    
+    def __call__(self, action, event_data):
+        print(f"ALERT: {action.get('message', 'Alert triggered')} - {event_data}")
+
+class _Job:
+    """A queued action with its retry state"""
+    
+    __slots__ = ('action', 'event_data', 'handler', 'attempt', 'due')
+    
+    def __init__(self, action, event_data, handler):
+        self.action = action
+        self.event_data = event_data
+        self.handler = handler
+        self.attempt = 0
+        self.due = time.monotonic()
+
+class ActionDispatcher:
+    """Worker pool that runs alert actions from per-destination queues with retry, backoff and circuit breaking"""
+    
+    def __init__(self, workers=ALERT_ACTION_WORKERS, max_retries=ALERT_ACTION_MAX_RETRIES,
+                 retry_backoff=ALERT_ACTION_RETRY_BACKOFF, queue_limit=ALERT_ACTION_QUEUE_LIMIT):
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.queue_limit = queue_limit
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.handlers = {}
+        self.register('webhook', WebhookAction(self.session))
+        self.register('email', EmailAction())
+        self.register('log', LogAction())
+        
+        # destination -> deque of jobs; a destination is handled by one worker at a time to keep its order
+        self.queues = {}
+        self.breakers = {}
+        self.ready = []
+        self.scheduled = set()
+        self.busy = set()
+        self.queued = 0
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        self.threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f'alert-action-{index}')
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+    
+    def register(self, action_type, handler):
+        """Register a handler: a callable(action, event_data) with a destination(action) method"""
+        self.handlers[action_type] = handler
+    
+    def dispatch(self, action, event_data):
+        """Queue an action; returns False if its type is unknown or the queue is full"""
+        handler = self.handlers.get(action.get('type'))
+        if handler is None:
+            print(f"Unknown alert action type: {action.get('type')}")
+            return False
+        
+        destination = handler.destination(action)
+        with self.condition:
+            if self.queued >= self.queue_limit:
+                print(f"Alert action queue full, dropping {action.get('type')} action")
+                return False
+            self.queues.setdefault(destination, deque()).append(_Job(action, event_data, handler))
+            self.queued += 1
+            self._schedule(destination)
+        return True
+    
+    def _schedule(self, destination):
+        """Make a destination's head job available to workers; call with the condition held"""
+        queue = self.queues.get(destination)
+        if not queue or destination in self.busy or destination in self.scheduled:
+            return
+        heapq.heappush(self.ready, (queue[0].due, next(self.sequence), destination))
+        self.scheduled.add(destination)
+        self.condition.notify()
+    
+    def _next_job(self):
+        """Wait for a due job on an idle destination and claim it; call with the condition held"""
+        while self.running:
+            if not self.ready:
+                self.condition.wait()
+                continue
+            due, _, destination = self.ready[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                self.condition.wait(delay)
+                continue
+            heapq.heappop(self.ready)
+            self.scheduled.discard(destination)
+            self.busy.add(destination)
+            return destination, self.queues[destination].popleft()
+        return None, None
+    
+    def _breaker(self, destination):
+        """Circuit breaker for one destination"""
+        if destination not in self.breakers:
+            self.breakers[destination] = CircuitBreaker(
+                destination, failure_rate=0.5, slow_call_seconds=ALERT_ACTION_TIMEOUT,
+                window_seconds=300, min_calls=3, open_seconds=60
+            )
+        return self.breakers[destination]
+    
+    def _worker(self):
+        """Run jobs until stopped"""
+        while self.running:
+            with self.condition:
+                destination, job = self._next_job()
+                breaker = self._breaker(destination) if job else None
+            if job is None:
+                break
+            
+            retry_in = None
+            channel = f"alert_{job.action.get('type')}"
+            start = time.perf_counter()
+            try:
+                breaker.call(job.handler, job.action, job.event_data)
+                record_delivery(channel, True, time.perf_counter() - start)
+            except CircuitOpenError as e:
+                # Hold the job until the destination may be healthy again, without using up a retry
+                retry_in = max(e.retry_after, self.retry_backoff)
+            except Exception as e:
+                record_delivery(channel, False, time.perf_counter() - start)
+                job.attempt += 1
+                if job.attempt <= self.max_retries:
+                    retry_in = self.retry_backoff * 2 ** (job.attempt - 1)
+                    print(f"Alert action to {destination} failed, retrying in {retry_in:.1f}s: {e}")
+                else:
+                    print(f"Giving up on alert action to {destination} after {job.attempt} attempts: {e}")
+            
+            with self.condition:
+                self.busy.discard(destination)
+                if retry_in is None:
+                    self.queued -= 1
+                else:
+                    job.due = time.monotonic() + retry_in
+                    self.queues[destination].appendleft(job)
+                self._schedule(destination)
+    
+    def stop(self, timeout=5):
+        """Stop the workers"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        self.session.close()
@@ -4,45 +4,64 @@ Yisel Web - Healthcare Documentation Automation Tool
 Web-based version of Yisel BOT by Mario Clavero
 """
 
-from flask import Flask, render_template, request, jsonify, session, send_from_directory
-from flask_socketio import SocketIO, emit
+from flask import Flask, render_template, request, jsonify, session, send_from_directory, g, Response
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import os
 import json
 import datetime
 import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.fernet import Fernet
 import sqlite3
-import psutil
 import requests
 import base64
 from PIL import Image, ImageDraw
 from io import BytesIO
 
 # Import our custom modules
-from automation_engine import AutomationEngine
+from automation_engine import AutomationEngine, BrowserWatchdog, TaskProgress, HARVEST_CONCURRENCY
+from circuit_breaker import CircuitOpenError
+from blocking import BlockingFacade, run_blocking
+from message_queue import socketio_queue_options
+from metrics import SystemSampler, SYSTEM_CHECK_INTERVAL, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, TASK_SECONDS
+from metrics import export_sample, render_prometheus
 from notification_system import NotificationManager, SystemMonitor, TaskNotificationHandler, AlertSystem, DEFAULT_ALERT_RULES
+from notification_system import SocketEventBatcher, SOCKET_CHANNELS, channel_room
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'yisel-web-secret-key-change-in-production')
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Share Socket.IO events between worker processes (e.g. redis://host:6379/0 or local:///tmp/yisel-socketio)
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+socketio = SocketIO(app, cors_allowed_origins="*", **socketio_queue_options(SOCKETIO_MESSAGE_QUEUE))
+
+# Configuration
+DEBUGGING_PORT = os.environ.get('DEBUGGING_PORT', '9222')
+LOW_BATTERY_THRESHOLD = int(os.environ.get('LOW_BATTERY_THRESHOLD', '20'))
+TASK_MAX_ATTEMPTS = int(os.environ.get('TASK_MAX_ATTEMPTS', '3'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_HISTORY_LIMIT = int(os.environ.get('JOB_HISTORY_LIMIT', '100'))
+BULK_SIGN_BATCH_SIZE = int(os.environ.get('BULK_SIGN_BATCH_SIZE', '25'))
+TASK_TYPES = ('sign', 'autofill', 'pipeline')
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', '30'))
+NOTIFICATION_RETENTION_ROWS = int(os.environ.get('NOTIFICATION_RETENTION_ROWS', '10000'))
+IPHONE_USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1"
 
 # Global variables
-automation_engine = AutomationEngine()
+# Engine calls made from request handlers run on OS threads so a busy browser never stalls the event loop
+automation_engine = BlockingFacade(AutomationEngine(debugging_port=DEBUGGING_PORT))
+event_batcher = SocketEventBatcher(socketio)
+system_sampler = SystemSampler()
 notification_manager = None
 system_monitor = None
 task_notification_handler = None
 alert_system = None
+browser_watchdog = None
 current_patients = []
 scheduled_tasks = {}
 task_monitor = None
 
-# Configuration
-DEBUGGING_PORT = os.environ.get('DEBUGGING_PORT', '9222')
-LOW_BATTERY_THRESHOLD = int(os.environ.get('LOW_BATTERY_THRESHOLD', '20'))
-IPHONE_USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1"
-
 # Language strings
 LANGUAGES = {
     "en": {
@@ -155,6 +174,31 @@ class DatabaseManager:
             )
         ''')
         
+        # Task progress table (step checkpoints for resuming interrupted tasks)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS task_progress (
+                task_id TEXT PRIMARY KEY,
+                steps TEXT,
+                state TEXT,
+                attempts INTEGER DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Notifications table (ids are monotonic so clients can sync deltas)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT,
+                title TEXT,
+                message TEXT,
+                type TEXT,
+                data TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications (user_id, id)')
+        
         # Settings table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS settings (
@@ -173,34 +217,273 @@ class DatabaseManager:
 # Initialize database
 db = DatabaseManager()
 
+class NotificationStore:
+    """Persists notifications in SQLite so they survive restarts and are shared between workers"""
+    
+    def __init__(self, database, retention_days=NOTIFICATION_RETENTION_DAYS, retention_rows=NOTIFICATION_RETENTION_ROWS):
+        self.db = database
+        self.retention_days = retention_days
+        self.retention_rows = retention_rows
+    
+    def save(self, notification, user_id=None):
+        """Store a notification and return its id"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO notifications (user_id, title, message, type, data)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            user_id,
+            notification.get('title'),
+            notification.get('message'),
+            notification.get('type'),
+            json.dumps(notification)
+        ))
+        notification_id = cursor.lastrowid
+        if notification_id % 100 == 0:
+            self._prune(cursor, notification_id)
+        conn.commit()
+        conn.close()
+        return notification_id
+    
+    def _prune(self, cursor, newest_id):
+        """Drop notifications past the retention age or row limit"""
+        cutoff = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute('DELETE FROM notifications WHERE created_at < ? OR id <= ?',
+                       (cutoff, newest_id - self.retention_rows))
+    
+    def load(self, user_id=None, limit=50, since=None):
+        """Load notifications; newest first, or oldest first after the since id"""
+        conditions = []
+        params = []
+        if user_id:
+            conditions.append('(user_id = ? OR user_id IS NULL)')
+            params.append(user_id)
+        if since is not None:
+            conditions.append('id > ?')
+            params.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = 'ASC' if since is not None else 'DESC'
+        
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT id, data FROM notifications {where} ORDER BY id {order} LIMIT ?', params + [limit])
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(json.loads(data), id=notification_id) for notification_id, data in rows]
+    
+    def clear(self, user_id=None):
+        """Delete a user's notifications and broadcasts, or everything"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        if user_id:
+            cursor.execute('DELETE FROM notifications WHERE user_id = ? OR user_id IS NULL', (user_id,))
+        else:
+            cursor.execute('DELETE FROM notifications')
+        conn.commit()
+        conn.close()
+
+def publish(event, data, channel, key=None):
+    """Send an event to clients subscribed to a channel, coalescing events that share a key"""
+    event_batcher.emit(event, data, channel_room(channel), key)
+
 # Initialize notification and monitoring systems
 def init_systems():
-    global notification_manager, system_monitor, task_notification_handler, alert_system
+    global notification_manager, system_monitor, task_notification_handler, alert_system, browser_watchdog
     
-    notification_manager = NotificationManager(socketio)
-    system_monitor = SystemMonitor(notification_manager, automation_engine)
-    task_notification_handler = TaskNotificationHandler(notification_manager)
+    notification_manager = NotificationManager(socketio, store=NotificationStore(db), batcher=event_batcher)
     alert_system = AlertSystem(notification_manager)
+    system_monitor = SystemMonitor(notification_manager, automation_engine, alert_system, system_sampler)
+    task_notification_handler = TaskNotificationHandler(notification_manager)
     
     # Add default alert rules
     for rule in DEFAULT_ALERT_RULES:
         alert_system.add_alert_rule(rule)
     
+    # Recycle the browser before it grows too large or too old
+    browser_watchdog = BrowserWatchdog(
+        automation_engine,
+        on_recycle=lambda reason: notification_manager.broadcast_notification(
+            'Browser Recycled', f'Browser session restarted ({reason})', 'info'
+        )
+    )
+    
+    # Tell users when Kinnser becomes unavailable and when it recovers
+    automation_engine.breaker.subscribe(notify_breaker_state)
+    
     # Start monitoring
     system_monitor.start_monitoring()
+    browser_watchdog.start()
+
+def notify_breaker_state(name, old_state, new_state, stats):
+    """Broadcast when a circuit breaker first opens and when it closes again"""
+    # Failed half-open probes reopen the breaker every cooldown; only the first opening is news
+    if new_state == 'open' and old_state == 'closed':
+        notification_manager.send_alert(
+            f'breaker:{name}',
+            f'{name} Unavailable',
+            f"{name} is failing or slow ({stats['failure_rate']:.0%} errors). Tasks are deferred until it recovers.",
+            'error'
+        )
+    elif new_state == 'closed' and old_state != 'closed':
+        notification_manager.resolve_alert(
+            f'breaker:{name}',
+            f'{name} Recovered',
+            f'{name} is responding again. Deferred tasks will resume.'
+        )
 
 # Initialize systems
 init_systems()
 
 # Remove old BrowserManager class - now using AutomationEngine
 
+class TaskProgressStore:
+    """Persists task step checkpoints so interrupted tasks can resume"""
+    
+    def __init__(self, database):
+        self.db = database
+    
+    def load(self, task_id):
+        """Load a task's checkpoints"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT steps, state FROM task_progress WHERE task_id = ?', (task_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        if not row:
+            return TaskProgress(task_id, store=self)
+        return TaskProgress(task_id, json.loads(row[0] or '[]'), json.loads(row[1] or '{}'), store=self)
+    
+    def save(self, task_id, steps, state):
+        """Save a task's checkpoints"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO task_progress (task_id, steps, state, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(task_id) DO UPDATE SET
+                steps = excluded.steps, state = excluded.state, updated_at = excluded.updated_at
+        ''', (task_id, json.dumps(steps), json.dumps(state), datetime.datetime.now().isoformat()))
+        conn.commit()
+        conn.close()
+    
+    def begin_attempt(self, task_id):
+        """Count an execution attempt and return how many there have been"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR IGNORE INTO task_progress (task_id, steps, state) VALUES (?, ?, ?)',
+                       (task_id, '[]', '{}'))
+        cursor.execute('UPDATE task_progress SET attempts = attempts + 1 WHERE task_id = ?', (task_id,))
+        cursor.execute('SELECT attempts FROM task_progress WHERE task_id = ?', (task_id,))
+        attempts = cursor.fetchone()[0]
+        conn.commit()
+        conn.close()
+        return attempts
+    
+    def clear(self, task_id):
+        """Forget a finished task's checkpoints"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM task_progress WHERE task_id = ?', (task_id,))
+        conn.commit()
+        conn.close()
+
+class JobManager:
+    """Runs long operations on a background executor and tracks their progress"""
+    
+    def __init__(self, max_workers=JOB_WORKERS, history_limit=JOB_HISTORY_LIMIT):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.history_limit = history_limit
+        self.jobs = {}
+        self.lock = threading.Lock()
+    
+    def submit(self, kind, func, *args):
+        """Queue func(job_id, *args) and return the new job's id"""
+        job_id = str(uuid.uuid4())
+        now = datetime.datetime.now().isoformat()
+        with self.lock:
+            self.jobs[job_id] = {
+                'job_id': job_id,
+                'kind': kind,
+                'status': 'queued',
+                'progress': {},
+                'result': None,
+                'error': None,
+                'created_at': now,
+                'updated_at': now
+            }
+            self._evict()
+        
+        self.executor.submit(self._run, job_id, func, args)
+        return job_id
+    
+    def _run(self, job_id, func, args):
+        """Run a job and record how it finished"""
+        self._update(job_id, status='running')
+        try:
+            result = func(job_id, *args)
+            self._update(job_id, status='completed', result=result)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self._update(job_id, status='failed', error=str(e))
+    
+    def progress(self, job_id, **progress):
+        """Record and stream incremental progress for a running job"""
+        self._update(job_id, progress=progress)
+    
+    def _update(self, job_id, progress=None, **fields):
+        """Update a job record and push it to clients"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return
+            if progress:
+                job['progress'].update(progress)
+            job.update(fields)
+            job['updated_at'] = datetime.datetime.now().isoformat()
+            snapshot = dict(job, progress=dict(job['progress']))
+        
+        publish('job_progress', snapshot, 'jobs', key=job_id)
+    
+    def _evict(self):
+        """Forget the oldest finished jobs beyond the history limit; call with the lock held"""
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in ('completed', 'failed')]
+        for job_id in finished[:max(0, len(self.jobs) - self.history_limit)]:
+            del self.jobs[job_id]
+    
+    def queue_depth(self):
+        """Number of jobs waiting for a worker"""
+        with self.lock:
+            return sum(1 for job in self.jobs.values() if job['status'] == 'queued')
+    
+    def get(self, job_id):
+        """Get a snapshot of a job record"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job, progress=dict(job['progress'])) if job else None
+
 class TaskScheduler:
     def __init__(self):
         self.running = True
+        self.current_attempts = 0
+        self.lock = threading.Lock()
+        self.progress_store = TaskProgressStore(db)
+        self.recover_interrupted_tasks()
         self.thread = threading.Thread(target=self.run_scheduler)
         self.thread.daemon = True
         self.thread.start()
     
+    def recover_interrupted_tasks(self):
+        """Requeue tasks that were running when the process stopped so they resume from their checkpoints"""
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE scheduled_tasks SET status = 'scheduled' WHERE status IN ('running', 'batched')")
+        if cursor.rowcount:
+            print(f"Resuming {cursor.rowcount} interrupted tasks")
+        conn.commit()
+        conn.close()
+    
     def run_scheduler(self):
         """Main scheduler loop"""
         while self.running:
@@ -213,6 +496,11 @@ class TaskScheduler:
     
     def check_scheduled_tasks(self):
         """Check for tasks that need to be executed"""
+        # While Kinnser is unavailable, leave due tasks scheduled instead of tying up the browser
+        if automation_engine.breaker.is_open():
+            print(f"Kinnser unavailable, deferring scheduled tasks for {automation_engine.breaker.retry_after():.0f}s")
+            return
+        
         conn = db.get_connection()
         cursor = conn.cursor()
         
@@ -224,56 +512,178 @@ class TaskScheduler:
         ''', (current_time,))
         
         tasks = cursor.fetchall()
+        conn.close()
         
-        for task in tasks:
-            try:
-                self.execute_task(task)
-                # Mark as completed
+        if tasks:
+            self.run_tasks(tasks)
+    
+    def run_tasks(self, tasks, on_result=None):
+        """Execute task rows one at a time, calling on_result(task, status) after each"""
+        summary = {'total': len(tasks), 'completed': 0, 'failed': 0, 'deferred': 0}
+        
+        # The scheduler and bulk jobs share one browser, so only one of them drives it at a time
+        with self.lock:
+            conn = db.get_connection()
+            cursor = conn.cursor()
+            
+            for index, task in enumerate(tasks):
                 cursor.execute('''
-                    UPDATE scheduled_tasks SET status = 'completed' WHERE id = ?
+                    UPDATE scheduled_tasks SET status = 'running' WHERE id = ?
                 ''', (task[0],))
                 conn.commit()
-            except Exception as e:
-                print(f"Task execution error: {e}")
+                
+                started = time.monotonic()
+                try:
+                    self.execute_task(task)
+                    status = 'completed'
+                except CircuitOpenError as e:
+                    # Remaining tasks stay scheduled and run once the breaker lets calls through
+                    print(f"Deferring remaining tasks: {e}")
+                    remaining = tasks[index:]
+                    cursor.executemany('''
+                        UPDATE scheduled_tasks SET status = 'scheduled' WHERE id = ?
+                    ''', [(t[0],) for t in remaining])
+                    conn.commit()
+                    summary['deferred'] = len(remaining)
+                    TASK_SECONDS.labels(task[3], 'deferred').observe(time.monotonic() - started)
+                    break
+                except Exception as e:
+                    print(f"Task execution error: {e}")
+                    error = e
+                    status = 'failed'
+                    if not automation_engine.check_connection() and not automation_engine.cloud_mode:
+                        # The browser died mid-task: restart it and resume from the last checkpoint
+                        if self.current_attempts < TASK_MAX_ATTEMPTS:
+                            automation_engine.recycle('browser lost during task')
+                            status = 'scheduled'
+                
                 cursor.execute('''
-                    UPDATE scheduled_tasks SET status = 'failed' WHERE id = ?
-                ''', (task[0],))
+                    UPDATE scheduled_tasks SET status = ? WHERE id = ?
+                ''', (status, task[0]))
                 conn.commit()
+                if status in ('completed', 'failed'):
+                    # Finished tasks never resume, so their checkpoints can go
+                    self.progress_store.clear(task[1])
+                
+                TASK_SECONDS.labels(task[3], 'retried' if status == 'scheduled' else status).observe(time.monotonic() - started)
+                if status in ('completed', 'failed'):
+                    alert_system.record_task(status == 'completed', time.monotonic() - started)
+                if status == 'failed':
+                    task_notification_handler.notify_task_failed(
+                        'system', dict(json.loads(task[6] or '{}'), task_type=task[3]), str(error)
+                    )
+                
+                if status == 'scheduled':
+                    summary['deferred'] += 1
+                else:
+                    summary[status] += 1
+                if on_result:
+                    on_result(task, status)
+            
+            conn.close()
         
-        conn.close()
+        return summary
     
     def execute_task(self, task):
         """Execute a scheduled task"""
         task_type = task[3]  # task_type column
         task_data = json.loads(task[6]) if task[6] else {}
+        self.current_attempts = self.progress_store.begin_attempt(task[1])
+        progress = self.progress_store.load(task[1])
         
         if task_type == 'sign':
-            self.execute_sign_task(task_data)
+            self.execute_sign_task(task_data, progress)
         elif task_type == 'autofill':
-            self.execute_autofill_task(task_data)
+            self.execute_autofill_task(task_data, progress)
+        elif task_type == 'pipeline':
+            self.execute_pipeline_task(task_data, progress)
+        else:
+            raise ValueError(f"Unknown task type: {task_type}")
         
         # Emit task completion to connected clients
-        socketio.emit('task_completed', {
+        completion = {
             'task_id': task[1],
             'type': task_type,
             'status': 'completed'
-        })
+        }
+        if task_type == 'pipeline':
+            completion['timings'] = automation_engine.last_pipeline_timings
+        publish('task_completed', completion, 'tasks')
     
-    def execute_sign_task(self, task_data):
+    def execute_sign_task(self, task_data, progress=None):
         """Execute a sign task"""
-        # Implementation for signing task
-        pass
+        if not automation_engine.execute_sign_task(task_data, progress):
+            raise RuntimeError("Sign task did not complete")
     
-    def execute_autofill_task(self, task_data):
+    def execute_autofill_task(self, task_data, progress=None):
         """Execute an autofill task"""
-        # Implementation for autofill task
-        pass
+        if not automation_engine.execute_autofill_task(task_data, progress):
+            raise RuntimeError("Autofill task did not complete")
+    
+    def execute_pipeline_task(self, task_data, progress=None):
+        """Execute an autofill-then-sign pipeline task"""
+        if not automation_engine.execute_pipeline_task(task_data, progress):
+            raise RuntimeError("Pipeline task did not complete")
     
     def stop(self):
         """Stop the scheduler"""
         self.running = False
 
 task_scheduler = TaskScheduler()
+job_manager = JobManager()
+
+# System metrics: one sampler feeds the history buffers, alerts and dashboard status events
+def collect_browser_metrics():
+    """Browser connection plus the watchdog's latest Chrome memory reading"""
+    metrics = {'browser_connected': automation_engine.check_connection()}
+    sample = browser_watchdog.last_sample if browser_watchdog else None
+    if sample:
+        metrics['chrome_rss_mb'] = sample['rss_mb']
+        metrics['chrome_processes'] = sample['processes']
+    return metrics
+
+def collect_queue_metrics():
+    """Depth of the task, job and ntfy queues"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COUNT(*) FROM scheduled_tasks WHERE status = 'scheduled' AND run_datetime <= ?
+    ''', (datetime.datetime.now().strftime('%Y-%m-%d %H:%M'),))
+    tasks_due = cursor.fetchone()[0]
+    conn.close()
+    return {
+        'tasks_due': tasks_due,
+        'jobs_queued': job_manager.queue_depth(),
+        'notifications_queued': notification_manager.ntfy_queue.queued
+    }
+
+def publish_system_status(sample):
+    """Push battery and browser status to dashboards"""
+    battery = sample.get('battery_percent')
+    if battery is not None and battery < LOW_BATTERY_THRESHOLD:
+        publish('low_battery_warning', {'level': battery}, 'system', key='battery')
+    if sample.get('browser_connected') is not None:
+        publish('browser_status', {'connected': sample['browser_connected']}, 'system', key='browser')
+
+system_sampler.add_collector(collect_browser_metrics, automation_engine.health.ttl)
+system_sampler.add_collector(collect_queue_metrics)
+system_sampler.subscribe(publish_system_status, SYSTEM_CHECK_INTERVAL)
+system_sampler.subscribe(export_sample)
+system_sampler.start()
+
+# Request metrics, labelled by route pattern so ids in URLs don't multiply the series
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.labels(request.method, route).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
+    return response
 
 # Routes
 @app.route('/')
@@ -333,16 +743,24 @@ def add_account():
 @app.route('/api/browser/status')
 def browser_status():
     """Get browser connection status"""
+    health = run_blocking(automation_engine.health.status)
     return jsonify({
-        'connected': automation_engine.is_connected,
-        'status': 'Connected to Kinnser ✔' if automation_engine.is_connected else 'Disconnected ❌'
+        'connected': health['connected'],
+        'status': 'Connected to Kinnser ✔' if health['connected'] else 'Disconnected ❌',
+        'checked_seconds_ago': health['checked_seconds_ago']
     })
 
 @app.route('/api/browser/connect', methods=['POST'])
 def connect_browser():
     """Connect to browser"""
-    success = automation_engine.setup_browser()
-    return jsonify({'success': success, 'connected': automation_engine.is_connected})
+    if automation_engine.check_connection():
+        success = True
+    elif automation_engine.driver:
+        # Replace the unresponsive browser rather than starting a second Chrome on the same debugging port
+        success = automation_engine.recycle('manual reconnect')
+    else:
+        success = bool(automation_engine.setup_driver())
+    return jsonify({'success': success, 'connected': automation_engine.check_connection()})
 
 @app.route('/api/patients')
 def get_patients():
@@ -432,13 +850,13 @@ def get_dashboard_stats():
         'completed_tasks': completed_tasks,
         'success_rate': round(success_rate, 1),
         'time_saved_hours': completed_tasks * 0.25,
-        'browser_connected': automation_engine.is_connected
+        'browser_connected': automation_engine.check_connection()
     })
 
 # New advanced API endpoints
 @app.route('/api/patients/fetch', methods=['POST'])
 def fetch_patients():
-    """Fetch patients from Kinnser"""
+    """Queue a job that fetches patients from Kinnser"""
     try:
         if not automation_engine.is_connected:
             return jsonify({'success': False, 'error': 'Browser not connected'})
@@ -454,6 +872,7 @@ def fetch_patients():
         cursor = conn.cursor()
         cursor.execute('SELECT username, password_encrypted FROM accounts WHERE id = ?', (account_id,))
         account = cursor.fetchone()
+        conn.close()
         
         if not account:
             return jsonify({'success': False, 'error': 'Account not found'})
@@ -465,40 +884,62 @@ def fetch_patients():
         cipher_suite = Fernet(key)
         password = cipher_suite.decrypt(encrypted_password).decode()
         
-        # Login and fetch patients
-        if automation_engine.login_to_kinnser(account[0], password):
-            patients = automation_engine.fetch_patients()
-            
-            # Store patients in database
-            for patient in patients:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO patients (patient_key, name, location, visits_data, last_updated)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    patient['patient_key'],
-                    patient['name'],
-                    patient.get('location'),
-                    json.dumps(patient.get('visits_data', [])),
-                    datetime.datetime.now().isoformat()
-                ))
-            
-            conn.commit()
-            conn.close()
-            
-            notification_manager.broadcast_notification(
-                'Patients Fetched',
-                f'Successfully fetched {len(patients)} patients from Kinnser',
-                'success'
-            )
-            
-            return jsonify({'success': True, 'count': len(patients)})
-        else:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Login failed'})
+        job_id = job_manager.submit('fetch_patients', run_patient_fetch, account[0], password)
+        return jsonify({'success': True, 'job_id': job_id})
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+def run_patient_fetch(job_id, username, password):
+    """Log in, scrape the patient list and store it, reporting progress as it goes"""
+    # The scheduler's lock serializes everything that drives the shared browser
+    with task_scheduler.lock:
+        job_manager.progress(job_id, stage='login')
+        if not automation_engine.login_to_kinnser(username, password):
+            raise RuntimeError('Login failed')
+        
+        job_manager.progress(job_id, stage='scrape')
+        patients = automation_engine.fetch_patients()
+    job_manager.progress(job_id, stage='store', pages_scraped=1, patients_found=len(patients), rows_upserted=0)
+    
+    # Store patients in database
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    try:
+        for index, patient in enumerate(patients, 1):
+            cursor.execute('''
+                INSERT OR REPLACE INTO patients (patient_key, name, location, visits_data, last_updated)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (
+                patient['patient_key'],
+                patient['name'],
+                patient.get('location'),
+                json.dumps(patient.get('visits_data', [])),
+                datetime.datetime.now().isoformat()
+            ))
+            if index % 25 == 0:
+                conn.commit()
+                job_manager.progress(job_id, rows_upserted=index)
+        conn.commit()
+    finally:
+        conn.close()
+    
+    job_manager.progress(job_id, stage='done', rows_upserted=len(patients))
+    notification_manager.broadcast_notification(
+        'Patients Fetched',
+        f'Successfully fetched {len(patients)} patients from Kinnser',
+        'success'
+    )
+    return {'count': len(patients)}
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Get the status and progress of a background job"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'})
+    return jsonify({'success': True, 'job': job})
+
 @app.route('/api/patients/<patient_key>/visits')
 def get_patient_visits(patient_key):
     """Get visits for a specific patient"""
@@ -519,6 +960,78 @@ def get_patient_visits(patient_key):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/visits/harvest', methods=['POST'])
+def harvest_visits():
+    """Refresh visits for many patients in the background"""
+    try:
+        data = request.json or {}
+        patient_keys = data.get('patient_keys')
+        
+        if not patient_keys:
+            conn = db.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT patient_key FROM patients ORDER BY name')
+            patient_keys = [row[0] for row in cursor.fetchall()]
+            conn.close()
+        
+        if not patient_keys:
+            return jsonify({'success': False, 'error': 'No patients to harvest'})
+        
+        # Each worker is a concurrent Kinnser connection, so never go past the configured limit
+        max_workers = data.get('max_workers')
+        if max_workers is not None:
+            try:
+                max_workers = min(max(int(max_workers), 1), HARVEST_CONCURRENCY)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': 'max_workers must be an integer'})
+        
+        job_id = job_manager.submit('harvest_visits', run_visit_harvest, patient_keys, max_workers)
+        return jsonify({'success': True, 'job_id': job_id, 'harvest_id': job_id, 'total': len(patient_keys)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def run_visit_harvest(job_id, patient_keys, max_workers=None):
+    """Harvest visits, streaming each patient's results into the database and to clients"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    progress = {'done': 0, 'total': len(patient_keys)}
+    
+    def store_visits(patient_key, visits, source):
+        progress['done'] += 1
+        if visits is not None:
+            cursor.execute('''
+                UPDATE patients SET visits_data = ?, last_updated = ?
+                WHERE patient_key = ?
+            ''', (json.dumps(visits), datetime.datetime.now().isoformat(), patient_key))
+            conn.commit()
+        
+        job_manager.progress(job_id, done=progress['done'], total=progress['total'])
+        publish('harvest_progress', {
+            'harvest_id': job_id,
+            'patient_key': patient_key,
+            'done': progress['done'],
+            'total': progress['total'],
+            'source': source,
+            'visits': len(visits) if visits is not None else None,
+            'signable': sum(1 for v in visits if v.get('signable')) if visits else 0
+        }, 'jobs')
+    
+    try:
+        summary = automation_engine.harvest_visits(patient_keys, store_visits, max_workers, task_scheduler.lock)
+    except Exception as e:
+        print(f"Visit harvest error: {e}")
+        summary = {'total': len(patient_keys), 'harvested': progress['done'], 'failed': len(patient_keys) - progress['done']}
+    finally:
+        conn.close()
+    
+    publish('harvest_completed', dict(summary, harvest_id=job_id), 'jobs')
+    notification_manager.broadcast_notification(
+        'Visits Harvested',
+        f"Refreshed visits for {summary['harvested']} of {summary['total']} patients",
+        'success' if not summary['failed'] else 'warning'
+    )
+    return summary
+
 @app.route('/api/signature')
 def signature_canvas():
     """Serve signature canvas page"""
@@ -580,6 +1093,215 @@ def schedule_task():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/tasks/schedule/batch', methods=['POST'])
+def schedule_tasks_batch():
+    """Schedule many tasks in one transaction"""
+    try:
+        data = request.json or {}
+        items = data.get('tasks')
+        if not isinstance(items, list) or not items:
+            return jsonify({'success': False, 'error': 'tasks must be a non-empty list'})
+        
+        # Validate everything before writing anything
+        errors = []
+        run_datetimes = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append({'index': index, 'error': 'Task must be an object'})
+                continue
+            missing = [field for field in ('patient_key', 'task_type', 'run_datetime') if not item.get(field)]
+            if missing:
+                errors.append({'index': index, 'error': f"Missing {', '.join(missing)}"})
+                continue
+            if item['task_type'] not in TASK_TYPES:
+                errors.append({'index': index, 'error': f"Unknown task type: {item['task_type']}"})
+                continue
+            try:
+                run_at = datetime.datetime.fromisoformat(item['run_datetime'])
+            except (TypeError, ValueError):
+                errors.append({'index': index, 'error': f"Invalid run_datetime: {item['run_datetime']}"})
+                continue
+            if run_at.tzinfo:
+                run_at = run_at.astimezone().replace(tzinfo=None)
+            # The scheduler compares run_datetime as a string against local 'YYYY-MM-DD HH:MM'
+            run_datetimes.append(run_at.strftime('%Y-%m-%d %H:%M'))
+        
+        if errors:
+            return jsonify({'success': False, 'error': 'Invalid tasks', 'errors': errors})
+        
+        tasks = insert_tasks([
+            (item['patient_key'], item['task_type'], run_datetime, item.get('task_data', {}))
+            for item, run_datetime in zip(items, run_datetimes)
+        ])
+        
+        run_times = sorted(run_datetimes)
+        task_notification_handler.notify_tasks_scheduled('system', len(tasks), run_times[0], run_times[-1])
+        
+        return jsonify({'success': True, 'task_ids': [task[1] for task in tasks]})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def insert_tasks(tasks, status='scheduled'):
+    """Insert (patient_key, task_type, run_datetime, task_data) tuples in one transaction and return their rows"""
+    rows = [(str(uuid.uuid4()), patient_key, task_type, run_datetime, status, json.dumps(task_data))
+            for patient_key, task_type, run_datetime, task_data in tasks]
+    
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT INTO scheduled_tasks (task_id, patient_key, task_type, run_datetime, status, task_data)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    
+    task_ids = [row[0] for row in rows]
+    inserted = []
+    for start in range(0, len(task_ids), 500):
+        chunk = task_ids[start:start + 500]
+        cursor.execute(f'''
+            SELECT * FROM scheduled_tasks WHERE task_id IN ({','.join('?' * len(chunk))}) ORDER BY id
+        ''', chunk)
+        inserted.extend(cursor.fetchall())
+    conn.close()
+    return inserted
+
+VISIT_DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y')
+
+def parse_visit_date(text):
+    """Parse a scraped visit date, or None if it's in no known format"""
+    for date_format in VISIT_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text.strip(), date_format).date()
+        except (AttributeError, ValueError):
+            continue
+    return None
+
+def find_signable_visits(patient_keys=None, date_from=None, date_to=None, signable=True):
+    """Resolve stored visits matching a filter into (patient_key, patient_name, visit) tuples"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    
+    # Visits that already have a sign task waiting or running would otherwise be queued twice
+    cursor.execute('''
+        SELECT patient_key, task_data FROM scheduled_tasks
+        WHERE task_type = 'sign' AND status IN ('scheduled', 'batched', 'running')
+    ''')
+    open_tasks = {
+        (patient_key, str(json.loads(task_data or '{}').get('visit_id')))
+        for patient_key, task_data in cursor.fetchall()
+    }
+    
+    if patient_keys:
+        cursor.execute(f'''
+            SELECT patient_key, name, visits_data FROM patients
+            WHERE patient_key IN ({','.join('?' * len(patient_keys))}) ORDER BY name
+        ''', list(patient_keys))
+    else:
+        cursor.execute('SELECT patient_key, name, visits_data FROM patients ORDER BY name')
+    patients = cursor.fetchall()
+    conn.close()
+    
+    matches = []
+    for patient_key, name, visits_data in patients:
+        for visit in json.loads(visits_data or '[]'):
+            if signable and not visit.get('signable'):
+                continue
+            if (patient_key, str(visit.get('visit_id'))) in open_tasks:
+                continue
+            if date_from or date_to:
+                visit_date = parse_visit_date(visit.get('date'))
+                if visit_date is None:
+                    continue
+                if date_from and visit_date < date_from:
+                    continue
+                if date_to and visit_date > date_to:
+                    continue
+            matches.append((patient_key, name, visit))
+    return matches
+
+@app.route('/api/tasks/sign-all', methods=['POST'])
+def sign_all_visits():
+    """Create sign tasks for every visit matching a filter and run them as one batched job"""
+    try:
+        data = request.json or {}
+        
+        # Every task draws the account's saved signature, so without one they would all fail
+        account_id = data.get('account_id')
+        if not account_id:
+            return jsonify({'success': False, 'error': 'Missing account_id'}), 400
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT signature_data FROM accounts WHERE id = ?', (account_id,))
+        account = cursor.fetchone()
+        conn.close()
+        if not account:
+            return jsonify({'success': False, 'error': 'Account not found'}), 400
+        if not account[0]:
+            return jsonify({'success': False, 'error': 'Account has no saved signature'}), 400
+        signature_data = json.loads(account[0])
+        
+        dates = {}
+        for field in ('date_from', 'date_to'):
+            try:
+                dates[field] = datetime.date.fromisoformat(data[field]) if data.get(field) else None
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': f"{field} must be an ISO date (YYYY-MM-DD)"}), 400
+        
+        visits = find_signable_visits(
+            data.get('patient_keys'),
+            dates['date_from'],
+            dates['date_to'],
+            data.get('signable', True)
+        )
+        if not visits:
+            return jsonify({'success': False, 'error': 'No matching visits to sign'})
+        
+        run_datetime = datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
+        tasks = insert_tasks([
+            (patient_key, 'sign', run_datetime, {
+                'patient_key': patient_key,
+                'patient_name': patient_name,
+                'visit_id': visit.get('visit_id'),
+                'visit_date': visit.get('date'),
+                'account_id': account_id,
+                'signature_data': signature_data
+            })
+            for patient_key, patient_name, visit in visits
+        ], status='batched')
+        
+        job_id = job_manager.submit('sign_all', run_bulk_sign, tasks)
+        return jsonify({'success': True, 'job_id': job_id, 'total': len(tasks)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def run_bulk_sign(job_id, tasks):
+    """Run bulk sign tasks in batches, reporting aggregate progress"""
+    totals = {'total': len(tasks), 'done': 0, 'completed': 0, 'failed': 0, 'deferred': 0}
+    
+    def record(task, status):
+        totals['done'] += 1
+        if status in ('completed', 'failed'):
+            totals[status] += 1
+        job_manager.progress(job_id, **totals)
+    
+    for start in range(0, len(tasks), BULK_SIGN_BATCH_SIZE):
+        summary = task_scheduler.run_tasks(tasks[start:start + BULK_SIGN_BATCH_SIZE], record)
+        totals['deferred'] += summary['deferred']
+        if automation_engine.breaker.is_open():
+            # Kinnser is down: hand the rest of the batch to the scheduler instead of failing it
+            remaining = [(task[0],) for task in tasks[start + BULK_SIGN_BATCH_SIZE:]]
+            if remaining:
+                conn = db.get_connection()
+                conn.executemany("UPDATE scheduled_tasks SET status = 'scheduled' WHERE id = ?", remaining)
+                conn.commit()
+                conn.close()
+                totals['deferred'] += len(remaining)
+            break
+    
+    job_manager.progress(job_id, **totals)
+    task_notification_handler.notify_batch_complete('system', totals['completed'], totals['total'])
+    return dict(totals)
+
 @app.route('/api/tasks/<task_id>/cancel', methods=['POST'])
 def cancel_task(task_id):
     """Cancel a scheduled task"""
@@ -591,6 +1313,7 @@ def cancel_task(task_id):
         ''', (task_id,))
         conn.commit()
         conn.close()
+        task_scheduler.progress_store.clear(task_id)
         
         return jsonify({'success': True})
     except Exception as e:
@@ -628,30 +1351,77 @@ def execute_task_now():
         data = request.json
         task_type = data.get('task_type')
         task_data = data.get('task_data', {})
+        started = time.monotonic()
         
         if task_type == 'autofill':
             success = automation_engine.execute_autofill_task(task_data)
         elif task_type == 'sign':
             success = automation_engine.execute_sign_task(task_data)
+        elif task_type == 'pipeline':
+            success = automation_engine.execute_pipeline_task(task_data)
         else:
             return jsonify({'success': False, 'error': 'Unknown task type'})
         
+        alert_system.record_task(bool(success), time.monotonic() - started)
         if success:
             task_notification_handler.notify_task_completed('system', task_data)
+            if task_type == 'autofill':
+                return jsonify({'success': True, 'autofill': automation_engine.last_autofill_result})
+            if task_type == 'pipeline':
+                return jsonify({
+                    'success': True,
+                    'autofill': automation_engine.last_autofill_result,
+                    'timings': automation_engine.last_pipeline_timings
+                })
             return jsonify({'success': True})
         else:
             task_notification_handler.notify_task_failed('system', task_data, 'Execution failed')
             return jsonify({'success': False, 'error': 'Task execution failed'})
     
+    except CircuitOpenError as e:
+        return jsonify({'success': False, 'deferred': True, 'retry_after': round(e.retry_after), 'error': str(e)})
     except Exception as e:
         task_notification_handler.notify_task_failed('system', data.get('task_data', {}), str(e))
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/metrics/history')
+def get_metrics_history():
+    """Get sampled system metrics at a resolution ('raw' or rollup seconds), optionally after ?since=<unix time>"""
+    resolution = request.args.get('resolution', 'raw')
+    since = request.args.get('since', type=float)
+    fields = request.args.get('fields')
+    try:
+        history = system_sampler.history.query(resolution, since, fields.split(',') if fields else None)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
+    
+    return jsonify({
+        'success': True,
+        'resolution': resolution,
+        'resolutions': system_sampler.history.resolutions(),
+        'latest': system_sampler.latest,
+        **history
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = render_prometheus()
+    return Response(body, content_type=content_type)
+
 @app.route('/api/notifications')
 def get_notifications():
-    """Get recent notifications"""
-    notifications = notification_manager.get_notifications(limit=50)
-    return jsonify({'notifications': notifications})
+    """Get recent notifications, or only those newer than ?since=<id>"""
+    since = request.args.get('since', type=int)
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    notifications = notification_manager.get_notifications(limit=limit, since=since)
+    
+    # Delta results come oldest first, so the last id is where the next poll resumes
+    if notifications:
+        last_id = max(n['id'] for n in notifications)
+    else:
+        last_id = since or 0
+    return jsonify({'notifications': notifications, 'last_id': last_id})
 
 @app.route('/api/notifications/clear', methods=['POST'])
 def clear_notifications():
@@ -661,10 +1431,33 @@ def clear_notifications():
 
 # WebSocket events
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     print('Client connected')
+    auth = auth or {}
+    
+    # Personal notifications go to the user's room, everything else to the channels the client asked for;
+    # the room comes from the server-side session only, never from what the client claims
+    join_room(session.get('user_id') or 'system')
+    channels = auth.get('channels') or SOCKET_CHANNELS
+    for channel in channels:
+        if channel in SOCKET_CHANNELS:
+            join_room(channel_room(channel))
+    
     emit('status', {'connected': True})
 
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Join more channels"""
+    for channel in (data or {}).get('channels', []):
+        if channel in SOCKET_CHANNELS:
+            join_room(channel_room(channel))
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    """Leave channels"""
+    for channel in (data or {}).get('channels', []):
+        leave_room(channel_room(channel))
+
 @socketio.on('disconnect')
 def handle_disconnect():
     print('Client disconnected')
@@ -675,30 +1468,6 @@ def handle_browser_check():
     status = automation_engine.check_connection()
     emit('browser_status', {'connected': status})
 
-# Background monitoring
-def monitor_system():
-    """Monitor system status and emit updates"""
-    while True:
-        try:
-            # Check battery level
-            battery = psutil.sensors_battery()
-            if battery and battery.percent < LOW_BATTERY_THRESHOLD:
-                socketio.emit('low_battery_warning', {'level': battery.percent})
-            
-            # Check browser connection
-            browser_status = automation_engine.check_connection()
-            socketio.emit('browser_status', {'connected': browser_status})
-            
-            time.sleep(60)  # Check every minute
-        except Exception as e:
-            print(f"Monitor error: {e}")
-            time.sleep(60)
-
-# Start background monitoring
-monitor_thread = threading.Thread(target=monitor_system)
-monitor_thread.daemon = True
-monitor_thread.start()
-
 if __name__ == '__main__':
     print("Starting Yisel Web Server...")
     port = int(os.environ.get('PORT', 5000))
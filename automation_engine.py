@@ -3,28 +3,204 @@ Advanced Automation Engine for Yisel Web
 Handles all browser automation, form filling, and signing operations
 """
 
+import os
 import time
 import json
 import datetime
+import threading
+import functools
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait, Select
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, WebDriverException, TimeoutException
+from selenium.webdriver.support.ui import Select
+from selenium.common.exceptions import NoSuchElementException, WebDriverException, TimeoutException, JavascriptException
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.common.keys import Keys
 from bs4 import BeautifulSoup
 import requests
 import base64
+import psutil
 from PIL import Image, ImageDraw
 from io import BytesIO
+from cdp_client import CDPClient, CDPError, CDPConnectionError, CDPTimeoutError
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from metrics import timed_operation
+
+# Engine backend: 'selenium' sends every command through chromedriver, 'cdp' talks to Chrome directly
+ENGINE_BACKEND = os.environ.get('ENGINE_BACKEND', 'selenium')
+
+class SeleniumBackend:
+    """Engine backend that sends commands through chromedriver"""
+    
+    name = 'selenium'
+    
+    def __init__(self, driver):
+        self.driver = driver
+    
+    @timed_operation('navigate')
+    def navigate(self, url, timeout=None):
+        """Load a URL"""
+        self.driver.get(url)
+    
+    def execute_script(self, script, *args):
+        """Run a script in the page and return its result"""
+        return self.driver.execute_script(script, *args)
+    
+    def execute_async_script(self, script, *args, timeout=None):
+        """Run a callback-style script in the page and return what it passes to its callback"""
+        return self.driver.execute_async_script(script, *args)
+    
+    def execute_cdp_cmd(self, method, params=None):
+        """Run a CDP command"""
+        return self.driver.execute_cdp_cmd(method, params or {})
+    
+    def send_paced(self, commands):
+        """Run (method, params, delay) CDP commands in order, pausing after each"""
+        for method, params, delay in commands:
+            self.driver.execute_cdp_cmd(method, params)
+            if delay:
+                time.sleep(delay)
+    
+    def close(self):
+        """Release backend resources"""
+        pass
+
+class CDPBackend:
+    """Engine backend that talks to Chrome over the DevTools websocket, falling back to Selenium"""
+    
+    name = 'cdp'
+    
+    def __init__(self, driver, port, page_load_strategy='normal'):
+        self.driver = driver
+        self.fallback = SeleniumBackend(driver)
+        self.page_load_strategy = page_load_strategy
+        self.client = CDPClient(port=port)
+        self.client.connect(target_id=driver.current_window_handle)
+        self.client.execute("Page.enable")
+        self.client.execute("Runtime.enable")
+    
+    @property
+    def active(self):
+        return self.client.connected
+    
+    def _fallback(self, error):
+        """Log a lost DevTools connection and route the command through Selenium"""
+        print(f"CDP backend unavailable, falling back to Selenium: {error}")
+        return self.fallback
+    
+    @timed_operation('navigate')
+    def navigate(self, url, timeout=None):
+        """Load a URL and wait for the load event the page load strategy calls for"""
+        if not self.active:
+            return self.fallback.navigate(url, timeout)
+        
+        event = "Page.domContentEventFired" if self.page_load_strategy == 'eager' else "Page.loadEventFired"
+        try:
+            wait = self.client.expect_event(event)
+            try:
+                result = self.client.execute("Page.navigate", {"url": url}, timeout)
+                if result.get('errorText'):
+                    raise WebDriverException(f"Navigation to {url} failed: {result['errorText']}")
+            except Exception:
+                wait.cancel()
+                raise
+            wait(timeout)
+        except CDPConnectionError as e:
+            self._fallback(e).navigate(url, timeout)
+        except CDPTimeoutError as e:
+            raise TimeoutException(str(e))
+        except CDPError as e:
+            raise WebDriverException(f"Navigation to {url} failed: {e}")
+    
+    def _evaluate(self, expression, await_promise=False, timeout=None):
+        """Evaluate an expression and return its value"""
+        try:
+            result = self.client.execute("Runtime.evaluate", {
+                "expression": expression,
+                "returnByValue": True,
+                "awaitPromise": await_promise
+            }, timeout)
+        except CDPConnectionError:
+            raise
+        except CDPError as e:
+            # Navigation destroys the execution context mid-evaluation
+            raise JavascriptException(str(e))
+        
+        if 'exceptionDetails' in result:
+            details = result['exceptionDetails']
+            message = details.get('exception', {}).get('description') or details.get('text')
+            raise JavascriptException(message)
+        return result.get('result', {}).get('value')
+    
+    def execute_script(self, script, *args):
+        """Run a script in the page and return its result"""
+        if not self.active:
+            return self.fallback.execute_script(script, *args)
+        
+        expression = f"(function () {{\n{script}\n}}).apply(null, {json.dumps(list(args))})"
+        try:
+            return self._evaluate(expression)
+        except CDPConnectionError as e:
+            return self._fallback(e).execute_script(script, *args)
+    
+    def execute_async_script(self, script, *args, timeout=None):
+        """Run a callback-style script in the page and return what it passes to its callback"""
+        if not self.active:
+            return self.fallback.execute_async_script(script, *args)
+        
+        expression = (
+            f"new Promise(function (resolve) {{ (function () {{\n{script}\n}})"
+            f".apply(null, {json.dumps(list(args))}.concat([resolve])); }})"
+        )
+        try:
+            return self._evaluate(expression, await_promise=True, timeout=timeout)
+        except CDPConnectionError as e:
+            return self._fallback(e).execute_async_script(script, *args)
+    
+    def execute_cdp_cmd(self, method, params=None):
+        """Run a CDP command"""
+        if not self.active:
+            return self.fallback.execute_cdp_cmd(method, params)
+        try:
+            return self.client.execute(method, params or {})
+        except CDPConnectionError as e:
+            return self._fallback(e).execute_cdp_cmd(method, params)
+        except CDPError as e:
+            raise WebDriverException(f"{method} failed: {e}")
+    
+    def send_paced(self, commands):
+        """Pipeline (method, params, delay) CDP commands, pausing after each send but not for replies"""
+        if not self.active:
+            return self.fallback.send_paced(commands)
+        
+        try:
+            futures = []
+            for method, params, delay in commands:
+                futures.append(self.client.send(method, params))
+                if delay:
+                    time.sleep(delay)
+            for future in futures:
+                self.client.result(future)
+        except CDPConnectionError as e:
+            # Commands already acknowledged cannot be told apart, so replay the whole batch
+            self._fallback(e).send_paced(commands)
+        except CDPError as e:
+            raise WebDriverException(f"CDP command failed: {e}")
+    
+    def close(self):
+        """Close the DevTools websocket"""
+        self.client.close()
 
 class SignatureManager:
     """Advanced signature drawing using Chrome DevTools Protocol"""
     
-    def __init__(self, driver):
+    def __init__(self, driver, backend=None):
         self.driver = driver
+        self.backend = backend or SeleniumBackend(driver)
     
     def _find_canvas_and_context(self):
         """Finds the canvas element, searching the main document and all iframes"""
@@ -58,6 +234,7 @@ class SignatureManager:
         
         return None, None
     
+    @timed_operation('draw_signature')
     def draw_signature(self, signature_data):
         """Draw signature using CDP commands for maximum reliability"""
         canvas, frame = self._find_canvas_and_context()
@@ -83,39 +260,38 @@ class SignatureManager:
                 x = canvas_x_start + start_point[0]
                 y = canvas_y_start + start_point[1]
                 
-                self.driver.execute_cdp_cmd("Input.dispatchMouseEvent", {
+                commands = [("Input.dispatchMouseEvent", {
                     "type": "mousePressed",
                     "x": x,
                     "y": y,
                     "button": "left",
                     "clickCount": 1
-                })
-                time.sleep(0.02)
+                }, 0.02)]
                 
                 # Draw stroke
                 for point in stroke[1:]:
                     x = canvas_x_start + point[0]
                     y = canvas_y_start + point[1]
-                    self.driver.execute_cdp_cmd("Input.dispatchMouseEvent", {
+                    commands.append(("Input.dispatchMouseEvent", {
                         "type": "mouseMoved",
                         "x": x,
                         "y": y,
                         "button": "left"
-                    })
-                    time.sleep(0.01)
+                    }, 0.01))
                 
                 # End stroke
                 end_point = stroke[-1]
                 x = canvas_x_start + end_point[0]
                 y = canvas_y_start + end_point[1]
-                self.driver.execute_cdp_cmd("Input.dispatchMouseEvent", {
+                commands.append(("Input.dispatchMouseEvent", {
                     "type": "mouseReleased",
                     "x": x,
                     "y": y,
                     "button": "left",
                     "clickCount": 1
-                })
-                time.sleep(0.05)
+                }, 0.05))
+                
+                self.backend.send_paced(commands)
             
             return True
         except Exception as e:
@@ -125,23 +301,442 @@ class SignatureManager:
             if frame:
                 self.driver.switch_to.default_content()
 
+FORM_HELPERS_SCRIPT = """
+function findElement(selectors) {
+    for (var i = 0; i < selectors.length; i++) {
+        try {
+            var element = document.querySelector(selectors[i]);
+            if (element) {
+                return [element, selectors[i]];
+            }
+        } catch (e) {
+            // Field names that are not valid CSS identifiers make some selectors invalid
+        }
+    }
+    return [null, null];
+}
+
+function setNativeValue(element, value) {
+    var prototype = element.tagName === 'TEXTAREA' ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+    var descriptor = Object.getOwnPropertyDescriptor(prototype, 'value');
+    if (descriptor && descriptor.set) {
+        descriptor.set.call(element, value);
+    } else {
+        element.value = value;
+    }
+}
+
+function readValue(element) {
+    if (element.tagName === 'SELECT') {
+        var option = element.options[element.selectedIndex];
+        return option ? option.text.trim() : null;
+    }
+    if (element.type === 'checkbox' || element.type === 'radio') {
+        return element.checked;
+    }
+    return element.value;
+}
+"""
+
+FILL_FORM_SCRIPT = FORM_HELPERS_SCRIPT + """
+var fields = arguments[0];
+var results = [];
+
+for (var i = 0; i < fields.length; i++) {
+    var name = fields[i][0], value = fields[i][1], selectors = fields[i][2];
+    var found = findElement(selectors), element = found[0];
+    var result = {field: name, selector: found[1], ok: false, value: null, error: null};
+
+    if (!element) {
+        result.error = 'not found';
+        results.push(result);
+        continue;
+    }
+
+    try {
+        if (element.tagName === 'SELECT') {
+            var index = -1, text = String(value);
+            for (var j = 0; j < element.options.length; j++) {
+                if (element.options[j].text.trim() === text) { index = j; break; }
+            }
+            if (index === -1) {
+                for (var j = 0; j < element.options.length; j++) {
+                    if (element.options[j].value === text) { index = j; break; }
+                }
+            }
+            if (index === -1) {
+                throw new Error('no option matching ' + text);
+            }
+            element.selectedIndex = index;
+        } else if (element.type === 'checkbox' || element.type === 'radio') {
+            if (element.checked !== !!value) {
+                element.click();
+            }
+        } else {
+            element.focus();
+            setNativeValue(element, value === null ? '' : String(value));
+        }
+        element.dispatchEvent(new Event('input', {bubbles: true}));
+        element.dispatchEvent(new Event('change', {bubbles: true}));
+        result.ok = true;
+    } catch (e) {
+        result.error = String(e && e.message || e);
+    }
+    result.value = readValue(element);
+    results.push(result);
+}
+return results;
+"""
+
+READ_FORM_SCRIPT = FORM_HELPERS_SCRIPT + """
+var fields = arguments[0];
+var results = [];
+
+for (var i = 0; i < fields.length; i++) {
+    var name = fields[i][0], selectors = fields[i][1];
+    var found = findElement(selectors), element = found[0];
+    var result = {field: name, selector: found[1], kind: null, value: null, option_value: null};
+
+    if (element) {
+        if (element.tagName === 'SELECT') {
+            result.kind = 'select';
+            result.option_value = element.value;
+        } else if (element.type === 'checkbox' || element.type === 'radio') {
+            result.kind = 'checkbox';
+        } else {
+            result.kind = 'text';
+        }
+        result.value = readValue(element);
+    }
+    results.push(result);
+}
+return results;
+"""
+
+WAIT_FOR_SELECTOR_SCRIPT = """
+var selector = arguments[0], timeoutMs = arguments[1], done = arguments[arguments.length - 1];
+var start = performance.now(), finished = false, observer = null, timer = null;
+
+function check() {
+    try {
+        return document.querySelector(selector);
+    } catch (e) {
+        return null;
+    }
+}
+
+function finish(element) {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    if (observer) {
+        observer.disconnect();
+    }
+    clearTimeout(timer);
+    done({element: element, elapsed: performance.now() - start});
+}
+
+var element = check();
+if (element) {
+    finish(element);
+} else {
+    observer = new MutationObserver(function () {
+        var found = check();
+        if (found) {
+            finish(found);
+        }
+    });
+    observer.observe(document, {childList: true, subtree: true, attributes: true});
+    timer = setTimeout(function () { finish(check()); }, timeoutMs);
+}
+"""
+
+# Page readiness timeouts in seconds
+READINESS_DEFAULT_TIMEOUT = float(os.environ.get('READINESS_TIMEOUT', '10'))
+READINESS_MIN_TIMEOUT = float(os.environ.get('READINESS_MIN_TIMEOUT', '2'))
+READINESS_MAX_TIMEOUT = float(os.environ.get('READINESS_MAX_TIMEOUT', '20'))
+
+# Default autofill mode: 'overwrite' applies every field, 'diff' only the ones that differ
+AUTOFILL_MODE = os.environ.get('AUTOFILL_MODE', 'overwrite')
+
+class SelectorCache:
+    """Persistent cache of the selector that last matched each form field"""
+    
+    def __init__(self, cache_path=None):
+        if cache_path is None:
+            if os.environ.get('RAILWAY_ENVIRONMENT'):
+                cache_path = "/tmp/yisel_selector_cache.json"
+            else:
+                cache_path = os.environ.get('SELECTOR_CACHE_PATH', 'selector_cache.json')
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+        self.selectors = self._load()
+    
+    def _load(self):
+        """Load cached selectors from disk"""
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save(self):
+        """Write cached selectors to disk"""
+        try:
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.selectors, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Failed to save selector cache: {e}")
+    
+    def get(self, form_type, field_name):
+        """Get the cached selector for a field, if any"""
+        with self.lock:
+            return self.selectors.get(form_type, {}).get(field_name)
+    
+    def update(self, form_type, winners):
+        """Remember the winning selector for each field and persist any changes"""
+        with self.lock:
+            form_selectors = self.selectors.setdefault(form_type, {})
+            changed = False
+            for field_name, selector in winners.items():
+                if form_selectors.get(field_name) != selector:
+                    form_selectors[field_name] = selector
+                    changed = True
+            if changed:
+                self._save()
+
+class FormFiller:
+    """Fills whole forms with a single injected script"""
+    
+    def __init__(self, driver, selector_cache, backend=None):
+        self.driver = driver
+        self.selector_cache = selector_cache
+        self.backend = backend or SeleniumBackend(driver)
+    
+    def candidate_selectors(self, form_type, field_name):
+        """Get selectors to try for a field, cached winner first"""
+        selectors = [
+            f"#{field_name}",
+            f"[name='{field_name}']",
+            f"[data-field='{field_name}']",
+            f".{field_name}"
+        ]
+        cached = self.selector_cache.get(form_type, field_name)
+        if cached:
+            selectors = [cached] + [s for s in selectors if s != cached]
+        return selectors
+    
+    @timed_operation('fill')
+    def fill(self, form_type, field_values):
+        """Apply all field values in one round-trip and return per-field results"""
+        fields = [
+            [field_name, value, self.candidate_selectors(form_type, field_name)]
+            for field_name, value in field_values.items()
+        ]
+        if not fields:
+            return {}
+        
+        results = self.backend.execute_script(FILL_FORM_SCRIPT, fields)
+        
+        self.selector_cache.update(form_type, {
+            r['field']: r['selector'] for r in results if r['selector']
+        })
+        
+        for r in results:
+            if not r['ok']:
+                print(f"Error filling field {r['field']}: {r['error']}")
+        
+        return {r['field']: r for r in results}
+    
+    def read(self, form_type, field_names):
+        """Read the current value of every field in one round-trip"""
+        fields = [
+            [field_name, self.candidate_selectors(form_type, field_name)]
+            for field_name in field_names
+        ]
+        if not fields:
+            return {}
+        
+        results = self.backend.execute_script(READ_FORM_SCRIPT, fields)
+        
+        self.selector_cache.update(form_type, {
+            r['field']: r['selector'] for r in results if r['selector']
+        })
+        
+        return {r['field']: r for r in results}
+    
+    def _value_matches(self, current, value):
+        """Check whether a field already holds the desired value"""
+        if current['kind'] == 'checkbox':
+            return current['value'] == bool(value)
+        
+        desired = '' if value is None else str(value)
+        if current['kind'] == 'select':
+            return desired in (current['value'], current['option_value'])
+        return current['value'] == desired
+    
+    def sync(self, form_type, field_values):
+        """Read the form, apply only the fields that differ and summarize what changed"""
+        current = self.read(form_type, field_values.keys())
+        
+        changes = {}
+        unchanged = []
+        missing = []
+        for field_name, value in field_values.items():
+            state = current.get(field_name)
+            if not state or not state['selector']:
+                missing.append(field_name)
+            elif self._value_matches(state, value):
+                unchanged.append(field_name)
+            else:
+                changes[field_name] = value
+        
+        results = self.fill(form_type, changes) if changes else {}
+        
+        for field_name in missing:
+            print(f"Error filling field {field_name}: not found")
+        
+        return {
+            'mode': 'diff',
+            'changed': [f for f, r in results.items() if r['ok']],
+            'failed': [f for f, r in results.items() if not r['ok']],
+            'unchanged': unchanged,
+            'missing': missing,
+            # Nothing to write only counts as a no-op rerun when every field was found
+            'idempotent': not results and not missing
+        }
+    
+    def apply(self, form_type, field_values, mode=None):
+        """Fill a form in the given autofill mode and summarize the outcome"""
+        mode = mode or AUTOFILL_MODE
+        if mode == 'diff':
+            return self.sync(form_type, field_values)
+        
+        results = self.fill(form_type, field_values)
+        return {
+            'mode': 'overwrite',
+            'changed': [f for f, r in results.items() if r['ok']],
+            'failed': [f for f, r in results.items() if r['selector'] and not r['ok']],
+            'unchanged': [],
+            'missing': [f for f, r in results.items() if not r['selector']],
+            'idempotent': False
+        }
+
+class PageReadiness:
+    """Event-driven page waits with per-page adaptive timeouts"""
+    
+    # Samples needed before a page's timeout adapts, and headroom over its p95 latency
+    MIN_SAMPLES = 5
+    HEADROOM = 3.0
+    # Each consecutive timeout on a page doubles its timeout, up to this factor
+    MAX_BACKOFF = 8
+    
+    def __init__(self, driver, backend=None, default_timeout=None, min_timeout=None, max_timeout=None):
+        self.driver = driver
+        self.backend = backend or SeleniumBackend(driver)
+        self.default_timeout = default_timeout or READINESS_DEFAULT_TIMEOUT
+        self.min_timeout = min_timeout or READINESS_MIN_TIMEOUT
+        self.max_timeout = max_timeout or READINESS_MAX_TIMEOUT
+        self.latencies = {}
+        self.backoff = {}
+        self.lock = threading.Lock()
+        self.driver.set_script_timeout(self.max_timeout + 5)
+    
+    @staticmethod
+    def _percentile(samples, pct):
+        """Nearest-rank percentile of a list of samples"""
+        ordered = sorted(samples)
+        index = max(0, int(round(pct / 100.0 * len(ordered))) - 1)
+        return ordered[min(index, len(ordered) - 1)]
+    
+    def timeout_for(self, page):
+        """Get the wait timeout for a page from its observed latencies"""
+        with self.lock:
+            samples = list(self.latencies.get(page, ()))
+            backoff = self.backoff.get(page, 1)
+        if len(samples) < self.MIN_SAMPLES:
+            timeout = self.default_timeout
+        else:
+            timeout = max(self.min_timeout, self._percentile(samples, 95) * self.HEADROOM)
+        return min(self.max_timeout, timeout * backoff)
+    
+    def _record(self, page, elapsed, timed_out=False):
+        """Record how long a page took to become ready, or that it timed out after elapsed seconds"""
+        with self.lock:
+            # A timed-out wait is a lower bound on the page's latency, so it still pulls the timeout up
+            self.latencies.setdefault(page, deque(maxlen=50)).append(elapsed)
+            if timed_out:
+                self.backoff[page] = min(self.backoff.get(page, 1) * 2, self.MAX_BACKOFF)
+            else:
+                self.backoff.pop(page, None)
+    
+    @timed_operation('wait')
+    def wait_for(self, selector, page=None, timeout=None, locate=False):
+        """Wait until an element matching the selector exists and return it"""
+        timeout = timeout or self.timeout_for(page)
+        start = time.monotonic()
+        deadline = start + timeout
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            
+            try:
+                result = self.backend.execute_async_script(
+                    WAIT_FOR_SELECTOR_SCRIPT, selector, int(remaining * 1000), timeout=remaining + 5
+                )
+            except JavascriptException:
+                # The document navigated away mid-wait; observe the new one
+                time.sleep(0.05)
+                continue
+            
+            if result and result.get('element') is not None:
+                self._record(page, time.monotonic() - start)
+                element = result['element']
+                if locate and not isinstance(element, WebElement):
+                    # The CDP backend returns values, not element handles
+                    element = self.driver.find_element(By.CSS_SELECTOR, selector)
+                return element
+            break
+        
+        self._record(page, time.monotonic() - start, timed_out=True)
+        raise TimeoutException(f"Timed out after {timeout:.1f}s waiting for '{selector}' on {page or 'page'}")
+    
+    def stats(self):
+        """Get latency percentiles and the current timeout for each page"""
+        with self.lock:
+            pages = {page: list(samples) for page, samples in self.latencies.items()}
+        return {
+            page: {
+                'samples': len(samples),
+                'p50': self._percentile(samples, 50),
+                'p95': self._percentile(samples, 95),
+                'timeout': self.timeout_for(page)
+            }
+            for page, samples in pages.items() if samples
+        }
+
 class KinnserAutomation:
     """Main automation engine for Kinnser operations"""
     
-    def __init__(self, driver):
+    def __init__(self, driver, selector_cache=None, backend=None):
         self.driver = driver
-        self.signature_manager = SignatureManager(driver)
-        self.wait = WebDriverWait(driver, 10)
+        self.backend = backend or SeleniumBackend(driver)
+        self.signature_manager = SignatureManager(driver, self.backend)
+        self.form_filler = FormFiller(driver, selector_cache or SelectorCache(), self.backend)
+        self.readiness = PageReadiness(driver, self.backend)
     
     def login(self, username, password):
         """Login to Kinnser"""
         try:
-            self.driver.get("https://www.kinnser.com/login")
+            self.backend.navigate("https://www.kinnser.com/login")
             
             # Wait for login form
-            username_field = self.wait.until(
-                EC.presence_of_element_located((By.ID, "username"))
-            )
+            username_field = self.readiness.wait_for("#username", 'login', locate=True)
             password_field = self.driver.find_element(By.ID, "password")
             
             username_field.clear()
@@ -154,9 +749,7 @@ class KinnserAutomation:
             login_button.click()
             
             # Wait for dashboard
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".dashboard, #dashboard, [data-page='dashboard']"))
-            )
+            self.readiness.wait_for(".dashboard, #dashboard, [data-page='dashboard']", 'dashboard')
             
             return True
         except Exception as e:
@@ -167,12 +760,10 @@ class KinnserAutomation:
         """Fetch patient list from Kinnser"""
         try:
             # Navigate to patient list
-            self.driver.get("https://www.kinnser.com/patients")
+            self.backend.navigate("https://www.kinnser.com/patients")
             
             # Wait for patient table
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".patient-table, #patient-list, [data-patients]"))
-            )
+            self.readiness.wait_for(".patient-table, #patient-list, [data-patients]", 'patients')
             
             # Extract patient data
             patients = []
@@ -203,12 +794,10 @@ class KinnserAutomation:
         """Get visits for a specific patient"""
         try:
             # Navigate to patient visits
-            self.driver.get(f"https://www.kinnser.com/patients/{patient_key}/visits")
+            self.backend.navigate(f"https://www.kinnser.com/patients/{patient_key}/visits")
             
             # Wait for visits table
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".visits-table, #visits-list"))
-            )
+            self.readiness.wait_for(".visits-table, #visits-list", 'visits')
             
             visits = []
             visit_rows = self.driver.find_elements(By.CSS_SELECTOR, "tr[data-visit], .visit-row")
@@ -235,58 +824,19 @@ class KinnserAutomation:
             print(f"Failed to get patient visits: {e}")
             return []
     
-    def autofill_note(self, patient_key, visit_id, note_data):
+    def autofill_note(self, patient_key, visit_id, note_data, mode=None):
         """Autofill a patient note"""
         try:
             # Navigate to note form
-            self.driver.get(f"https://www.kinnser.com/patients/{patient_key}/visits/{visit_id}/note")
+            self.backend.navigate(f"https://www.kinnser.com/patients/{patient_key}/visits/{visit_id}/note")
             
             # Wait for form
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "form, .note-form"))
-            )
+            self.readiness.wait_for("form, .note-form", 'note')
             
-            # Fill form fields
-            for field_name, value in note_data.items():
-                try:
-                    # Try different field selectors
-                    selectors = [
-                        f"#{field_name}",
-                        f"[name='{field_name}']",
-                        f"[data-field='{field_name}']",
-                        f".{field_name}"
-                    ]
-                    
-                    element = None
-                    for selector in selectors:
-                        try:
-                            element = self.driver.find_element(By.CSS_SELECTOR, selector)
-                            break
-                        except NoSuchElementException:
-                            continue
-                    
-                    if element:
-                        if element.tag_name == 'select':
-                            select = Select(element)
-                            try:
-                                select.select_by_visible_text(value)
-                            except:
-                                select.select_by_value(value)
-                        elif element.tag_name == 'textarea':
-                            element.clear()
-                            element.send_keys(value)
-                        elif element.get_attribute('type') == 'checkbox':
-                            if value and not element.is_selected():
-                                element.click()
-                            elif not value and element.is_selected():
-                                element.click()
-                        else:
-                            element.clear()
-                            element.send_keys(value)
-                
-                except Exception as e:
-                    print(f"Error filling field {field_name}: {e}")
-                    continue
+            # Fill the form, optionally touching only fields that differ
+            result = self.form_filler.apply('note', note_data, mode)
+            if result['missing']:
+                raise RuntimeError(f"Fields not found: {', '.join(result['missing'])}")
             
             return True
         except Exception as e:
@@ -297,12 +847,10 @@ class KinnserAutomation:
         """Sign a patient note"""
         try:
             # Navigate to signing page
-            self.driver.get(f"https://www.kinnser.com/patients/{patient_key}/visits/{visit_id}/sign")
+            self.backend.navigate(f"https://www.kinnser.com/patients/{patient_key}/visits/{visit_id}/sign")
             
             # Wait for signing form
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".signature-form, #signature-section"))
-            )
+            self.readiness.wait_for(".signature-form, #signature-section", 'sign')
             
             if sign_method == 'draw_signature' and signature_data:
                 # Draw signature
@@ -328,9 +876,7 @@ class KinnserAutomation:
             submit_button.click()
             
             # Wait for confirmation
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".success, .confirmation, [data-success]"))
-            )
+            self.readiness.wait_for(".success, .confirmation, [data-success]", 'confirmation')
             
             return True
         except Exception as e:
@@ -341,12 +887,10 @@ class KinnserAutomation:
         """Change patient location"""
         try:
             # Navigate to patient location page
-            self.driver.get(f"https://www.kinnser.com/patients/{patient_key}/location")
+            self.backend.navigate(f"https://www.kinnser.com/patients/{patient_key}/location")
             
             # Wait for location form
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".location-form, #location-section"))
-            )
+            self.readiness.wait_for(".location-form, #location-section", 'location')
             
             # Fill location fields
             for field, value in location_data.items():
@@ -373,14 +917,400 @@ class KinnserAutomation:
             print(f"Location change failed: {e}")
             return False
 
+# Parallel HTTP requests used when harvesting visits
+HARVEST_CONCURRENCY = int(os.environ.get('HARVEST_CONCURRENCY', '4'))
+
+class KinnserHttpClient:
+    """Fetches Kinnser pages over HTTP using the browser's session cookies"""
+    
+    def __init__(self, cookies, user_agent=None, pool_size=HARVEST_CONCURRENCY, timeout=15):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        if user_agent:
+            self.session.headers['User-Agent'] = user_agent
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain'), path=cookie.get('path', '/')
+            )
+    
+    @classmethod
+    def from_driver(cls, driver, pool_size=HARVEST_CONCURRENCY):
+        """Create a client sharing the logged-in browser session"""
+        user_agent = driver.execute_script("return navigator.userAgent")
+        return cls(driver.get_cookies(), user_agent, pool_size)
+    
+    @staticmethod
+    def parse_visits(html):
+        """Parse a visits page, or return None when it is not a server-rendered visits table"""
+        soup = BeautifulSoup(html, 'html.parser')
+        if not soup.select_one(".visits-table, #visits-list"):
+            return None
+        
+        visits = []
+        for row in soup.select("tr[data-visit], .visit-row"):
+            date_element = row.select_one(".visit-date, [data-date]")
+            status_element = row.select_one(".visit-status, [data-status]")
+            if not date_element or not status_element:
+                continue
+            
+            status = status_element.get_text(strip=True)
+            visits.append({
+                'visit_id': row.get("data-visit-id"),
+                'date': date_element.get_text(strip=True),
+                'status': status,
+                'signable': 'unsigned' in status.lower()
+            })
+        return visits
+    
+    def get_patient_visits(self, patient_key):
+        """Get visits for a patient, or None if the page needs the browser"""
+        response = self.session.get(
+            f"https://www.kinnser.com/patients/{patient_key}/visits",
+            timeout=self.timeout
+        )
+        if response.status_code != 200 or '/login' in response.url:
+            return None
+        return self.parse_visits(response.text)
+    
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
+# Named browser profiles selected with BROWSER_PROFILE
+BROWSER_PROFILES = {
+    'default': {
+        'page_load_strategy': 'normal',
+        'disable_images': False,
+        'disk_cache_size': None,
+        'blocked_urls': [],
+        'allowed_urls': []
+    },
+    'performance': {
+        'page_load_strategy': 'eager',
+        'disable_images': True,
+        'disk_cache_size': 64 * 1024 * 1024,
+        'blocked_urls': [
+            '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.ico', '*.webp',
+            '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+            '*.mp4', '*.webm', '*.mp3',
+            '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+            '*hotjar.com*', '*newrelic.com*', '*nr-data.net*', '*fullstory.com*',
+            '*facebook.net*', '*intercom.io*'
+        ],
+        'allowed_urls': []
+    }
+}
+
+def _split_patterns(value):
+    """Parse a comma-separated list of URL patterns"""
+    return [p.strip() for p in value.split(',') if p.strip()]
+
+def load_browser_profile(name=None):
+    """Build the browser profile, applying BLOCKED_URL_PATTERNS/ALLOWED_URL_PATTERNS overrides"""
+    name = name or os.environ.get('BROWSER_PROFILE', 'default')
+    if name not in BROWSER_PROFILES:
+        print(f"Unknown browser profile '{name}', using default")
+        name = 'default'
+    
+    profile = dict(BROWSER_PROFILES[name], name=name)
+    if os.environ.get('BLOCKED_URL_PATTERNS'):
+        profile['blocked_urls'] = _split_patterns(os.environ['BLOCKED_URL_PATTERNS'])
+    if os.environ.get('ALLOWED_URL_PATTERNS'):
+        profile['allowed_urls'] = _split_patterns(os.environ['ALLOWED_URL_PATTERNS'])
+    if os.environ.get('BROWSER_CACHE_DIR'):
+        profile['disk_cache_dir'] = os.environ['BROWSER_CACHE_DIR']
+    return profile
+
+# Browser recycling thresholds
+BROWSER_RECYCLE_TASKS = int(os.environ.get('BROWSER_RECYCLE_TASKS', '200'))
+BROWSER_RECYCLE_RSS_MB = int(os.environ.get('BROWSER_RECYCLE_RSS_MB', '1500'))
+BROWSER_RECYCLE_AGE_HOURS = float(os.environ.get('BROWSER_RECYCLE_AGE_HOURS', '12'))
+BROWSER_WATCHDOG_INTERVAL = int(os.environ.get('BROWSER_WATCHDOG_INTERVAL', '30'))
+
+# Seconds between session cookie snapshots kept for restarting a crashed browser
+SESSION_COOKIE_INTERVAL = float(os.environ.get('SESSION_COOKIE_INTERVAL', '300'))
+
+# Seconds a browser health reading stays fresh
+BROWSER_HEALTH_TTL = float(os.environ.get('BROWSER_HEALTH_TTL', '15'))
+
+# Login page messages shown for rejected credentials
+LOGIN_ERROR_SELECTOR = ".login-error, .error-message, .validation-summary-errors, [data-login-error]"
+
+# Kinnser circuit breaker thresholds
+KINNSER_BREAKER_FAILURE_RATE = float(os.environ.get('KINNSER_BREAKER_FAILURE_RATE', '0.5'))
+KINNSER_BREAKER_SLOW_SECONDS = float(os.environ.get('KINNSER_BREAKER_SLOW_SECONDS', '8'))
+KINNSER_BREAKER_WINDOW = int(os.environ.get('KINNSER_BREAKER_WINDOW', '120'))
+KINNSER_BREAKER_MIN_CALLS = int(os.environ.get('KINNSER_BREAKER_MIN_CALLS', '4'))
+KINNSER_BREAKER_OPEN_SECONDS = int(os.environ.get('KINNSER_BREAKER_OPEN_SECONDS', '60'))
+
+class AuthenticationError(Exception):
+    """Kinnser answered but rejected the login credentials"""
+    pass
+
+def engine_operation(method=None, breaker=True, slow_calls=True):
+    """Track a browser operation for recycling, health, latency metrics and the Kinnser circuit breaker"""
+    # Used bare as @engine_operation or as @engine_operation(breaker=False)
+    # Multi-page tasks pass slow_calls=False: their length says nothing about Kinnser's latency
+    if method is None:
+        return functools.partial(engine_operation, breaker=breaker, slow_calls=slow_calls)
+    timed = timed_operation(method.__name__)(method)
+    
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        guarded = breaker and self._breaker_guarded()
+        if guarded and not self.breaker.allow_request():
+            raise CircuitOpenError(self.breaker.name, self.breaker.retry_after())
+        
+        outermost = self._begin_operation()
+        start = time.monotonic()
+        succeeded = False
+        try:
+            result = timed(self, *args, **kwargs)
+            succeeded = result is not False
+            if succeeded and outermost:
+                self._save_cookies()
+            return result
+        except AuthenticationError:
+            # Kinnser responded; a mistyped password must not open the breaker for everyone
+            succeeded = True
+            raise
+        finally:
+            self._end_operation(outermost)
+            if guarded:
+                self.breaker.record(succeeded, time.monotonic() - start if slow_calls else None)
+            if outermost:
+                if succeeded:
+                    self.health.mark(True)
+                else:
+                    self.health.invalidate()
+    return wrapper
+
+class BrowserHealth:
+    """TTL-cached browser health shared by every status reader"""
+    
+    def __init__(self, engine, ttl=None):
+        self.engine = engine
+        self.ttl = ttl or BROWSER_HEALTH_TTL
+        self.lock = threading.Lock()
+        self.connected = False
+        self.checked_at = 0
+        self.last_error = None
+        self.listeners = []
+    
+    def subscribe(self, callback):
+        """Call callback(connected) whenever the health state flips"""
+        self.listeners.append(callback)
+    
+    def mark(self, connected, error=None):
+        """Record a health observation, e.g. from a finished browser operation"""
+        with self.lock:
+            changed = connected != self.connected
+            self.connected = connected
+            self.checked_at = time.monotonic()
+            self.last_error = error
+        
+        self.engine.is_connected = connected
+        if changed:
+            for callback in list(self.listeners):
+                try:
+                    callback(connected)
+                except Exception as e:
+                    print(f"Browser health listener error: {e}")
+    
+    def invalidate(self):
+        """Force the next reader to probe the browser"""
+        with self.lock:
+            self.checked_at = 0
+    
+    def probe(self):
+        """Ping the browser with a lightweight CDP command that never touches the page"""
+        if self.engine.cloud_mode or not self.engine.driver or not self.engine.backend:
+            self.mark(False)
+            return False
+        
+        try:
+            self.engine.backend.execute_cdp_cmd("Browser.getVersion", {})
+            self.mark(True)
+            return True
+        except Exception as e:
+            self.mark(False, str(e))
+            return False
+    
+    def get(self):
+        """Get the cached health, probing only when the reading is stale"""
+        with self.lock:
+            fresh = time.monotonic() - self.checked_at < self.ttl
+            connected = self.connected
+        
+        if fresh:
+            return connected
+        
+        # A browser busy with real work is alive; don't compete with it for the driver
+        if connected and self.engine.inflight:
+            return True
+        return self.probe()
+    
+    def status(self):
+        """Get the health state for status endpoints"""
+        connected = self.get()
+        with self.lock:
+            return {
+                'connected': connected,
+                'checked_seconds_ago': round(time.monotonic() - self.checked_at, 1),
+                'error': self.last_error
+            }
+
+class BrowserWatchdog:
+    """Recycles the browser after too many tasks, too much memory or too much age"""
+    
+    def __init__(self, engine, on_recycle=None, max_tasks=None, max_rss_mb=None,
+                 max_age_hours=None, interval=None):
+        self.engine = engine
+        self.on_recycle = on_recycle
+        self.max_tasks = max_tasks or BROWSER_RECYCLE_TASKS
+        self.max_rss_mb = max_rss_mb or BROWSER_RECYCLE_RSS_MB
+        self.max_age_seconds = (max_age_hours or BROWSER_RECYCLE_AGE_HOURS) * 3600
+        self.interval = interval or BROWSER_WATCHDOG_INTERVAL
+        self.running = False
+        self.thread = None
+        self.last_sample = None
+    
+    def start(self):
+        """Start the watchdog thread"""
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._watch_loop)
+            self.thread.daemon = True
+            self.thread.start()
+    
+    def stop(self):
+        """Stop the watchdog thread"""
+        self.running = False
+    
+    def sample(self):
+        """Measure RSS and process count of the driver's process tree"""
+        driver = self.engine.driver
+        service = getattr(driver, 'service', None) if driver else None
+        process = getattr(service, 'process', None)
+        if not process:
+            return None
+        
+        try:
+            root = psutil.Process(process.pid)
+            tree = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+        
+        rss = 0
+        for proc in tree:
+            try:
+                rss += proc.memory_info().rss
+            except psutil.Error:
+                continue
+        
+        return {
+            'rss_mb': round(rss / (1024 * 1024), 1),
+            'processes': len(tree),
+            'tasks': self.engine.operations_since_start,
+            'age_seconds': round(time.time() - self.engine.started_at) if self.engine.started_at else 0
+        }
+    
+    def recycle_reason(self, sample):
+        """Get why the browser should be recycled, or None"""
+        if sample['tasks'] >= self.max_tasks:
+            return f"{sample['tasks']} tasks since start"
+        if sample['rss_mb'] >= self.max_rss_mb:
+            return f"memory at {sample['rss_mb']} MB across {sample['processes']} processes"
+        if sample['age_seconds'] >= self.max_age_seconds:
+            return f"running for {sample['age_seconds'] / 3600:.1f} hours"
+        return None
+    
+    def check(self):
+        """Sample the browser and recycle it if a threshold is exceeded"""
+        sample = self.sample()
+        self.last_sample = sample
+        if not sample:
+            return False
+        
+        reason = self.recycle_reason(sample)
+        if not reason:
+            return False
+        
+        if self.engine.recycle(reason) and self.on_recycle:
+            self.on_recycle(reason)
+        return True
+    
+    def _watch_loop(self):
+        """Main watchdog loop"""
+        while self.running:
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Browser watchdog error: {e}")
+            time.sleep(self.interval)
+
+class TaskProgress:
+    """Checkpointed step completion for a multi-step task"""
+    
+    def __init__(self, task_id=None, steps=None, state=None, store=None):
+        self.task_id = task_id
+        self.steps = list(steps or [])
+        self.state = dict(state or {})
+        self.store = store
+    
+    def is_done(self, step):
+        """Check whether a step completed in this or an earlier attempt"""
+        return step in self.steps
+    
+    def checkpoint(self, step, **state):
+        """Record a completed step and persist it"""
+        if step not in self.steps:
+            self.steps.append(step)
+        self.state.update(state)
+        self.state['last_step'] = step
+        if self.store and self.task_id:
+            try:
+                self.store.save(self.task_id, self.steps, self.state)
+            except Exception as e:
+                print(f"Failed to checkpoint task {self.task_id} at {step}: {e}")
+
 class AutomationEngine:
     """Main automation engine for Yisel Web"""
     
-    def __init__(self):
+    def __init__(self, profile=None, debugging_port=None, backend=None):
         self.driver = None
-        self.wait = None
+        self.backend = None
+        self.saved_cookies = []
+        self.cookies_saved_at = 0
+        self.backend_name = backend or ENGINE_BACKEND
+        self.debugging_port = debugging_port or os.environ.get('DEBUGGING_PORT', '9222')
+        self.readiness = None
         self.signature_manager = None
+        self.form_filler = None
+        self.selector_cache = SelectorCache()
+        self.last_autofill_result = None
+        self.last_pipeline_timings = {}
         self.is_connected = False
+        self.activity = threading.Condition()
+        self.operation_state = threading.local()
+        self.inflight = 0
+        self.draining = False
+        self.started_at = None
+        self.operations_since_start = 0
+        self.recycle_count = 0
+        self.health = BrowserHealth(self)
+        self.breaker = CircuitBreaker(
+            'Kinnser',
+            failure_rate=KINNSER_BREAKER_FAILURE_RATE,
+            slow_call_seconds=KINNSER_BREAKER_SLOW_SECONDS,
+            window_seconds=KINNSER_BREAKER_WINDOW,
+            min_calls=KINNSER_BREAKER_MIN_CALLS,
+            open_seconds=KINNSER_BREAKER_OPEN_SECONDS
+        )
+        self.profile = load_browser_profile(profile)
         self.cloud_mode = self._detect_cloud_environment()
         self.setup_driver()
     
@@ -406,31 +1336,187 @@ class AutomationEngine:
             chrome_options.add_argument("--disable-dev-shm-usage")
             chrome_options.add_argument("--disable-gpu")
             chrome_options.add_argument("--window-size=1920,1080")
-            chrome_options.add_argument("--remote-debugging-port=9222")
+            chrome_options.add_argument(f"--remote-debugging-port={self.debugging_port}")
+            self._apply_profile_options(chrome_options)
             
             self.driver = webdriver.Chrome(options=chrome_options)
-            self.wait = WebDriverWait(self.driver, 10)
-            self.signature_manager = SignatureManager(self.driver)
+            self.backend = self._create_backend()
+            self._apply_network_profile()
+            self.readiness = PageReadiness(self.driver, self.backend)
+            self.signature_manager = SignatureManager(self.driver, self.backend)
+            self.form_filler = FormFiller(self.driver, self.selector_cache, self.backend)
             
-            self.is_connected = True
+            self.started_at = time.time()
+            self.operations_since_start = 0
+            self.health.mark(True)
             print("Browser automation setup successful")
             return True
         except Exception as e:
             print(f"Browser setup failed: {e}")
-            self.is_connected = False
+            self.health.mark(False, str(e))
             return False
     
-    def check_connection(self):
-        """Check if browser is still connected"""
+    def _create_backend(self):
+        """Create the configured engine backend, falling back to Selenium"""
+        if self.backend_name == 'cdp':
+            try:
+                backend = CDPBackend(self.driver, self.debugging_port, self.profile['page_load_strategy'])
+                print(f"CDP backend connected on port {self.debugging_port}")
+                return backend
+            except CDPError as e:
+                print(f"CDP backend unavailable, using Selenium: {e}")
+        return SeleniumBackend(self.driver)
+    
+    def _apply_profile_options(self, chrome_options):
+        """Apply the browser profile's launch options"""
+        profile = self.profile
+        chrome_options.page_load_strategy = profile['page_load_strategy']
+        
+        if profile['disable_images']:
+            chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+            chrome_options.add_experimental_option("prefs", {
+                "profile.managed_default_content_settings.images": 2
+            })
+        
+        if profile['disk_cache_size']:
+            chrome_options.add_argument(f"--disk-cache-size={profile['disk_cache_size']}")
+        if profile.get('disk_cache_dir'):
+            chrome_options.add_argument(f"--disk-cache-dir={profile['disk_cache_dir']}")
+        
+        if profile['name'] != 'default':
+            for argument in ("--disable-extensions", "--disable-background-networking",
+                             "--disable-sync", "--disable-default-apps", "--mute-audio",
+                             "--disable-component-update", "--no-first-run"):
+                chrome_options.add_argument(argument)
+    
+    def _apply_network_profile(self):
+        """Block the profile's URL patterns via CDP"""
+        blocked = self.profile['blocked_urls']
+        if not blocked:
+            return
+        
+        allowed = self.profile['allowed_urls']
         try:
-            if self.driver:
-                self.driver.current_url
-                self.is_connected = True
-                return True
-        except:
-            self.is_connected = False
+            self.backend.execute_cdp_cmd("Network.enable", {})
+            if allowed:
+                try:
+                    # Chrome evaluates urlPatterns in order, so allow entries win over deny entries
+                    self.backend.execute_cdp_cmd("Network.setBlockedURLs", {
+                        "urlPatterns": [{"urlPattern": p, "block": False} for p in allowed] +
+                                       [{"urlPattern": p, "block": True} for p in blocked]
+                    })
+                except (WebDriverException, CDPError):
+                    print("Chrome does not support allow patterns, blocking deny patterns only")
+                    allowed = []
+            if not allowed:
+                self.backend.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked})
+            print(f"Browser profile '{self.profile['name']}' blocking {len(blocked)} URL patterns")
+        except (WebDriverException, CDPError) as e:
+            print(f"Failed to apply network profile: {e}")
+    
+    def _breaker_guarded(self):
+        """Check whether an operation starting now should go through the circuit breaker"""
+        # Only outermost operations against a live browser say anything about Kinnser itself
+        return (not self.cloud_mode and self.is_connected
+                and not getattr(self.operation_state, 'depth', 0))
+    
+    def _begin_operation(self):
+        """Register an outermost operation, waiting while the browser is being recycled"""
+        depth = getattr(self.operation_state, 'depth', 0)
+        self.operation_state.depth = depth + 1
+        if depth:
             return False
+        
+        with self.activity:
+            while self.draining:
+                self.activity.wait()
+            self.inflight += 1
+        return True
     
+    def _end_operation(self, outermost):
+        """Finish an operation, releasing the drain gate for outermost ones"""
+        self.operation_state.depth -= 1
+        if not outermost:
+            return
+        
+        with self.activity:
+            self.inflight -= 1
+            self.operations_since_start += 1
+            self.activity.notify_all()
+    
+    def recycle(self, reason, drain_timeout=120):
+        """Restart the browser once in-flight work drains, keeping the session cookies"""
+        if self.cloud_mode or not self.driver:
+            return False
+        
+        with self.activity:
+            if self.draining:
+                return False
+            self.draining = True
+            deadline = time.monotonic() + drain_timeout
+            while self.inflight and time.monotonic() < deadline:
+                self.activity.wait(deadline - time.monotonic())
+            if self.inflight:
+                print(f"Browser recycle postponed: {self.inflight} operations still running")
+                self.draining = False
+                self.activity.notify_all()
+                return False
+        
+        try:
+            print(f"Recycling browser: {reason}")
+            try:
+                cookies = self.driver.get_cookies()
+            except WebDriverException as e:
+                # A crashed browser can't hand over its cookies; use those from the last healthy operation
+                print(f"Could not save cookies before recycle, using the last saved session: {e}")
+                cookies = self.saved_cookies
+            
+            self.quit()
+            if not self.setup_driver():
+                return False
+            
+            self._restore_cookies(cookies)
+            self.recycle_count += 1
+            return True
+        finally:
+            with self.activity:
+                self.draining = False
+                self.activity.notify_all()
+    
+    def _save_cookies(self, force=False):
+        """Keep the session cookies of a healthy browser so a restart after a crash stays logged in"""
+        # get_cookies is a round-trip, so after login it only runs every SESSION_COOKIE_INTERVAL
+        if not self.driver or (not force and time.monotonic() - self.cookies_saved_at < SESSION_COOKIE_INTERVAL):
+            return
+        try:
+            self.saved_cookies = self.driver.get_cookies()
+            self.cookies_saved_at = time.monotonic()
+        except WebDriverException as e:
+            print(f"Could not save session cookies: {e}")
+    
+    def _restore_cookies(self, cookies):
+        """Restore session cookies into a fresh browser"""
+        if not cookies:
+            return
+        
+        try:
+            # Cookies can only be added for the domain currently loaded
+            self.backend.navigate("https://www.kinnser.com/")
+        except WebDriverException as e:
+            print(f"Could not restore cookies: {e}")
+            return
+        
+        for cookie in cookies:
+            try:
+                self.driver.add_cookie(cookie)
+            except WebDriverException as e:
+                print(f"Could not restore cookie {cookie.get('name')}: {e}")
+    
+    def check_connection(self):
+        """Check if browser is still connected, using the cached health state"""
+        return self.health.get()
+    
+    @engine_operation
     def login_to_kinnser(self, username, password):
         """Login to Kinnser"""
         if self.cloud_mode:
@@ -443,12 +1529,10 @@ class AutomationEngine:
         
         try:
             # Navigate to Kinnser login
-            self.driver.get("https://www.kinnser.com/login")
+            self.backend.navigate("https://www.kinnser.com/login")
             
             # Fill login form
-            username_field = self.wait.until(
-                EC.presence_of_element_located((By.NAME, "username"))
-            )
+            username_field = self.readiness.wait_for("[name='username']", 'login', locate=True)
             password_field = self.driver.find_element(By.NAME, "password")
             
             username_field.send_keys(username)
@@ -458,16 +1542,20 @@ class AutomationEngine:
             login_button = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit'], input[type='submit']")
             login_button.click()
             
-            # Wait for dashboard
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".dashboard, #main-content"))
-            )
+            # Wait for the dashboard, or for the login page to report bad credentials
+            self.readiness.wait_for(f".dashboard, #main-content, {LOGIN_ERROR_SELECTOR}", 'dashboard')
+            if not self.driver.find_elements(By.CSS_SELECTOR, ".dashboard, #main-content"):
+                raise AuthenticationError(f"Kinnser rejected the credentials for {username}")
             
+            self._save_cookies(force=True)
             return True
+        except AuthenticationError:
+            raise
         except Exception as e:
             print(f"Kinnser login failed: {e}")
             return False
     
+    @engine_operation
     def fetch_patients(self):
         """Fetch patients from Kinnser"""
         if self.cloud_mode:
@@ -491,17 +1579,16 @@ class AutomationEngine:
                 }
             ]
             
+        # Failures raise so the operation isn't recorded as a healthy call
         if not self.is_connected:
-            return []
+            raise WebDriverException("Browser not connected")
         
         try:
             # Navigate to patients page
-            self.driver.get("https://www.kinnser.com/patients")
+            self.backend.navigate("https://www.kinnser.com/patients")
             
             # Wait for patient list
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".patient-list, #patients-table"))
-            )
+            self.readiness.wait_for(".patient-list, #patients-table", 'patients')
             
             patients = []
             patient_rows = self.driver.find_elements(By.CSS_SELECTOR, "tr[data-patient], .patient-row")
@@ -526,8 +1613,9 @@ class AutomationEngine:
             return patients
         except Exception as e:
             print(f"Failed to fetch patients: {e}")
-            return []
+            raise
     
+    @engine_operation
     def get_patient_visits(self, patient_key):
         """Get visits for a patient"""
         if self.cloud_mode:
@@ -547,44 +1635,183 @@ class AutomationEngine:
                 }
             ]
             
+        # Failures raise so the operation isn't recorded as a healthy call
         if not self.is_connected:
-            return []
+            raise WebDriverException("Browser not connected")
         
         try:
-            # Navigate to patient visits
-            self.driver.get(f"https://www.kinnser.com/patients/{patient_key}/visits")
-            
-            # Wait for visits table
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".visits-table, #visits-list"))
-            )
-            
-            visits = []
-            visit_rows = self.driver.find_elements(By.CSS_SELECTOR, "tr[data-visit], .visit-row")
-            
-            for row in visit_rows:
+            return self._get_patient_visits_from_browser(patient_key)
+        except Exception as e:
+            print(f"Failed to get patient visits: {e}")
+            raise
+    
+    def _get_patient_visits_from_browser(self, patient_key):
+        """Scrape a patient's visits table through the browser"""
+        # Navigate to patient visits
+        self.backend.navigate(f"https://www.kinnser.com/patients/{patient_key}/visits")
+        
+        # Wait for visits table
+        self.readiness.wait_for(".visits-table, #visits-list", 'visits')
+        
+        visits = []
+        visit_rows = self.driver.find_elements(By.CSS_SELECTOR, "tr[data-visit], .visit-row")
+        
+        for row in visit_rows:
+            try:
+                visit_id = row.get_attribute("data-visit-id")
+                date_element = row.find_element(By.CSS_SELECTOR, ".visit-date, [data-date]")
+                status_element = row.find_element(By.CSS_SELECTOR, ".visit-status, [data-status]")
+                
+                visit = {
+                    'visit_id': visit_id,
+                    'date': date_element.text.strip(),
+                    'status': status_element.text.strip(),
+                    'signable': 'unsigned' in status_element.text.lower()
+                }
+                visits.append(visit)
+            except Exception as e:
+                print(f"Error extracting visit data: {e}")
+                continue
+        
+        return visits
+    
+    @engine_operation(breaker=False)
+    def harvest_visits(self, patient_keys, on_result=None, max_workers=None, browser_lock=None):
+        """Fetch visits for many patients with bounded concurrency, reporting each as it arrives"""
+        # browser_lock is held whenever the harvest drives the shared browser
+        browser_lock = browser_lock or contextlib.nullcontext()
+        # A harvest runs for minutes, so it checks the breaker instead of feeding its latency
+        if self._breaker_guarded() and self.breaker.is_open():
+            raise CircuitOpenError(self.breaker.name, self.breaker.retry_after())
+        
+        summary = {'total': len(patient_keys), 'harvested': 0, 'failed': 0, 'browser_fallback': 0}
+        
+        def report(patient_key, visits, source):
+            if visits is None:
+                summary['failed'] += 1
+            else:
+                summary['harvested'] += 1
+            if on_result:
                 try:
-                    visit_id = row.get_attribute("data-visit-id")
-                    date_element = row.find_element(By.CSS_SELECTOR, ".visit-date, [data-date]")
-                    status_element = row.find_element(By.CSS_SELECTOR, ".visit-status, [data-status]")
-                    
-                    visit = {
-                        'visit_id': visit_id,
-                        'date': date_element.text.strip(),
-                        'status': status_element.text.strip(),
-                        'signable': 'unsigned' in status_element.text.lower()
-                    }
-                    visits.append(visit)
+                    on_result(patient_key, visits, source)
                 except Exception as e:
-                    print(f"Error extracting visit data: {e}")
-                    continue
-            
-            return visits
+                    print(f"Harvest result handler error: {e}")
+        
+        if self.cloud_mode:
+            for patient_key in patient_keys:
+                report(patient_key, self.get_patient_visits(patient_key), 'mock')
+            return summary
+        
+        if not self.is_connected:
+            for patient_key in patient_keys:
+                report(patient_key, None, 'unavailable')
+            return summary
+        
+        max_workers = max_workers or HARVEST_CONCURRENCY
+        needs_browser = []
+        try:
+            with browser_lock:
+                http_client = KinnserHttpClient.from_driver(self.driver, max_workers)
         except Exception as e:
-            print(f"Failed to get patient visits: {e}")
-            return []
+            print(f"HTTP fast path unavailable, harvesting through the browser: {e}")
+            http_client = None
+            needs_browser = list(patient_keys)
+        
+        if http_client:
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {
+                        executor.submit(http_client.get_patient_visits, patient_key): patient_key
+                        for patient_key in patient_keys
+                    }
+                    for future in as_completed(futures):
+                        patient_key = futures[future]
+                        try:
+                            visits = future.result()
+                        except Exception as e:
+                            print(f"HTTP visit harvest failed for {patient_key}: {e}")
+                            visits = None
+                        
+                        if visits is None:
+                            needs_browser.append(patient_key)
+                        else:
+                            report(patient_key, visits, 'http')
+            finally:
+                http_client.close()
+        
+        # Pages the fast path could not parse go through the single browser serially
+        for patient_key in needs_browser:
+            summary['browser_fallback'] += 1
+            try:
+                with browser_lock:
+                    visits = self._get_patient_visits_from_browser(patient_key)
+            except Exception as e:
+                print(f"Browser visit harvest failed for {patient_key}: {e}")
+                visits = None
+            report(patient_key, visits, 'browser')
+        
+        return summary
+    
+    def _visit_is_signed(self, patient_key, visit_id):
+        """Check the visits list to see whether a visit is already signed; None when it can't be told"""
+        try:
+            visits = self._get_patient_visits_from_browser(patient_key)
+        except Exception as e:
+            print(f"Could not verify visit {visit_id}: {e}")
+            return None
+        
+        # Scraped ids are strings, task data may hold numbers
+        for visit in visits:
+            if str(visit['visit_id']) == str(visit_id):
+                return not visit['signable'] and 'signed' in visit['status'].lower()
+        return None
+    
+    def _resume_after_submit(self, patient_key, visit_id, progress):
+        """After an earlier submit, get True when the visit is signed, False to sign again; raises when unknown"""
+        if not progress.is_done('submit'):
+            return False
+        signed = self._visit_is_signed(patient_key, visit_id)
+        if signed is None:
+            # Signing again could submit the note twice, so give up until the visit can be checked
+            raise RuntimeError(f"Could not verify whether visit {visit_id} was already signed")
+        if signed:
+            progress.checkpoint('confirm', verified=True)
+        return signed
+    
+    def _sign_loaded_page(self, task_data, progress, timings=None):
+        """Draw, submit and confirm a signature on the page that is already loaded"""
+        timings = timings if timings is not None else {}
+        
+        # Use signature manager to draw signature
+        started = time.monotonic()
+        if not self.signature_manager or not task_data.get('signature_data'):
+            return False
+        if not self.signature_manager.draw_signature(task_data['signature_data']):
+            return False
+        progress.checkpoint('draw')
+        
+        # Submit signature, recording the attempt first so a crash mid-click is verified on resume
+        submit_button = self.driver.find_element(
+            By.CSS_SELECTOR, 
+            "button[type='submit'], .submit-signature, #sign-submit"
+        )
+        progress.checkpoint('submit', submitted_at=datetime.datetime.now().isoformat())
+        submit_button.click()
+        timings['sign'] = round(time.monotonic() - started, 3)
+        
+        # Confirm the signature was accepted
+        started = time.monotonic()
+        try:
+            self.readiness.wait_for(".success, .confirmation, [data-success]", 'confirmation')
+        except TimeoutException:
+            if self._visit_is_signed(task_data['patient_key'], task_data['visit_id']) is not True:
+                return False
+        progress.checkpoint('confirm')
+        timings['confirm'] = round(time.monotonic() - started, 3)
+        return True
     
-    def execute_autofill_task(self, task_data):
+    @engine_operation(slow_calls=False)
+    def execute_autofill_task(self, task_data, progress=None):
         """Execute an autofill task"""
         if self.cloud_mode:
             print("Cloud mode: Autofill simulation completed")
@@ -593,50 +1820,38 @@ class AutomationEngine:
         if not self.is_connected:
             return False
         
+        progress = progress or TaskProgress()
+        mode = task_data.get('autofill_mode')
+        if progress.is_done('fill'):
+            # An earlier attempt already wrote fields; only touch the ones that still differ
+            mode = 'diff'
+        
         try:
             # Navigate to note form
-            self.driver.get(f"https://www.kinnser.com/patients/{task_data['patient_key']}/visits/{task_data['visit_id']}/note")
+            self.backend.navigate(f"https://www.kinnser.com/patients/{task_data['patient_key']}/visits/{task_data['visit_id']}/note")
+            progress.checkpoint('navigate')
             
             # Wait for form
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "form, .note-form"))
-            )
+            self.readiness.wait_for("form, .note-form", 'note')
+            progress.checkpoint('wait')
             
-            # Fill form fields
-            for field_name, value in task_data['note_data'].items():
-                try:
-                    selectors = [
-                        f"#{field_name}",
-                        f"[name='{field_name}']",
-                        f"[data-field='{field_name}']",
-                        f".{field_name}"
-                    ]
-                    
-                    element = None
-                    for selector in selectors:
-                        try:
-                            element = self.driver.find_element(By.CSS_SELECTOR, selector)
-                            break
-                        except NoSuchElementException:
-                            continue
-                    
-                    if element:
-                        if element.tag_name.lower() == 'select':
-                            select = Select(element)
-                            select.select_by_visible_text(value)
-                        else:
-                            element.clear()
-                            element.send_keys(value)
-                except Exception as e:
-                    print(f"Error filling field {field_name}: {e}")
-                    continue
+            # Fill the form, optionally touching only fields that differ
+            self.last_autofill_result = self.form_filler.apply(
+                task_data.get('form_type', 'note'),
+                task_data['note_data'],
+                mode
+            )
+            if self.last_autofill_result['missing']:
+                raise RuntimeError(f"Fields not found: {', '.join(self.last_autofill_result['missing'])}")
+            progress.checkpoint('fill', changed=self.last_autofill_result['changed'])
             
             return True
         except Exception as e:
             print(f"Autofill task failed: {e}")
             return False
     
-    def execute_sign_task(self, task_data):
+    @engine_operation(slow_calls=False)
+    def execute_sign_task(self, task_data, progress=None):
         """Execute a signing task"""
         if self.cloud_mode:
             print("Cloud mode: Signature simulation completed")
@@ -645,32 +1860,107 @@ class AutomationEngine:
         if not self.is_connected:
             return False
         
+        progress = progress or TaskProgress()
+        patient_key = task_data['patient_key']
+        visit_id = task_data['visit_id']
+        
+        if progress.is_done('confirm'):
+            print(f"Sign task {progress.task_id} already confirmed")
+            return True
+        
         try:
+            # An earlier attempt clicked submit; never sign twice if that went through
+            if self._resume_after_submit(patient_key, visit_id, progress):
+                return True
+            
             # Navigate to signing page
-            self.driver.get(f"https://www.kinnser.com/patients/{task_data['patient_key']}/visits/{task_data['visit_id']}/sign")
+            self.backend.navigate(f"https://www.kinnser.com/patients/{patient_key}/visits/{visit_id}/sign")
+            progress.checkpoint('navigate')
             
             # Wait for signature area
-            self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "canvas, .signature-pad, #signature-area"))
-            )
+            self.readiness.wait_for("canvas, .signature-pad, #signature-area", 'sign')
+            progress.checkpoint('wait')
             
-            # Use signature manager to draw signature
-            if self.signature_manager and task_data.get('signature_data'):
-                success = self.signature_manager.draw_signature(task_data['signature_data'])
-                if success:
-                    # Submit signature
-                    submit_button = self.driver.find_element(
-                        By.CSS_SELECTOR, 
-                        "button[type='submit'], .submit-signature, #sign-submit"
-                    )
-                    submit_button.click()
-                    return True
+            return self._sign_loaded_page(task_data, progress)
+        except Exception as e:
+            print(f"Sign task failed: {e}")
+            return False
+    
+    @engine_operation(slow_calls=False)
+    def execute_pipeline_task(self, task_data, progress=None):
+        """Autofill, save, sign and confirm a visit's note in one browser session"""
+        if self.cloud_mode:
+            print("Cloud mode: Pipeline simulation completed")
+            return True
             
+        if not self.is_connected:
             return False
+        
+        progress = progress or TaskProgress()
+        patient_key = task_data['patient_key']
+        visit_id = task_data['visit_id']
+        timings = {}
+        self.last_pipeline_timings = timings
+        
+        if progress.is_done('confirm'):
+            print(f"Pipeline task {progress.task_id} already confirmed")
+            return True
+        
+        try:
+            if self._resume_after_submit(patient_key, visit_id, progress):
+                return True
+            
+            if not progress.is_done('save'):
+                # Autofill stage
+                started = time.monotonic()
+                self.backend.navigate(f"https://www.kinnser.com/patients/{patient_key}/visits/{visit_id}/note")
+                self.readiness.wait_for("form, .note-form", 'note')
+                mode = 'diff' if progress.is_done('fill') else task_data.get('autofill_mode')
+                self.last_autofill_result = self.form_filler.apply(
+                    task_data.get('form_type', 'note'), task_data.get('note_data', {}), mode
+                )
+                if self.last_autofill_result['missing']:
+                    raise RuntimeError(f"Fields not found: {', '.join(self.last_autofill_result['missing'])}")
+                # A note is never saved and signed with fields that failed to fill
+                if self.last_autofill_result['failed']:
+                    raise RuntimeError(f"Fields failed to fill: {', '.join(self.last_autofill_result['failed'])}")
+                progress.checkpoint('fill', changed=self.last_autofill_result['changed'])
+                timings['autofill'] = round(time.monotonic() - started, 3)
+                
+                # Save stage; notes without a save button autosave
+                started = time.monotonic()
+                save_buttons = self.driver.find_elements(
+                    By.CSS_SELECTOR, "#save-note, .save-note, [data-action='save'], button[name='save']"
+                )
+                if save_buttons:
+                    # Mark the document so a save that navigates is seen as done: the next page's body is unmarked
+                    self.backend.execute_script("document.body.setAttribute('data-yisel-saving', '1');")
+                    save_buttons[0].click()
+                    self.readiness.wait_for(
+                        ".saved, .save-success, [data-saved], body:not([data-yisel-saving])", 'note_save'
+                    )
+                progress.checkpoint('save')
+                timings['save'] = round(time.monotonic() - started, 3)
+            
+            # Sign stage, staying on the note page when it already shows the signature pad
+            started = time.monotonic()
+            has_signature_area = self.backend.execute_script(
+                "return !!document.querySelector('canvas, .signature-pad, #signature-area');"
+            )
+            if has_signature_area:
+                progress.checkpoint('navigate', sign_page='note')
+            else:
+                self.backend.navigate(f"https://www.kinnser.com/patients/{patient_key}/visits/{visit_id}/sign")
+                self.readiness.wait_for("canvas, .signature-pad, #signature-area", 'sign')
+                progress.checkpoint('navigate', sign_page='sign')
+            timings['navigate_sign'] = round(time.monotonic() - started, 3)
+            
+            return self._sign_loaded_page(task_data, progress, timings)
         except Exception as e:
-            print(f"Sign task failed: {e}")
+            print(f"Pipeline task failed: {e}")
             return False
     
+    @engine_operation
     def change_patient_location(self, patient_key, location_data):
         """Change patient location"""
         if not self.is_connected or not self.kinnser:
@@ -680,6 +1970,9 @@ class AutomationEngine:
     
     def quit(self):
         """Quit the browser"""
+        if self.backend:
+            self.backend.close()
+            self.backend = None
         if self.driver:
             try:
                 self.driver.quit()
@@ -687,4 +1980,4 @@ class AutomationEngine:
                 pass
             self.driver = None
             self.kinnser = None
-            self.is_connected = False
+            self.health.mark(False)
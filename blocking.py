@@ -0,0 +1,50 @@
+"""
+Blocking call offloading for Yisel Web
+Keeps Selenium and system calls from stalling the eventlet hub that serves HTTP and Socket.IO
+"""
+
+import functools
+
+try:
+    import greenlet
+    from eventlet import tpool
+except ImportError:
+    greenlet = None
+    tpool = None
+
+def in_event_loop():
+    """Check whether the caller is a green thread scheduled by the eventlet hub"""
+    if greenlet is None:
+        return False
+    # Hub-scheduled green threads have the hub as parent; OS threads run in their own root greenlet
+    return greenlet.getcurrent().parent is not None
+
+def run_blocking(func, *args, **kwargs):
+    """Call func on a real OS thread when called from a green thread, otherwise call it directly"""
+    if in_event_loop():
+        return tpool.execute(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+class BlockingFacade:
+    """Wraps an object so its method calls never block the event loop"""
+
+    def __init__(self, target):
+        object.__setattr__(self, '_target', target)
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            return run_blocking(value, *args, **kwargs)
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    @property
+    def target(self):
+        """The wrapped object, for code that must call it directly"""
+        return self._target
@@ -0,0 +1,194 @@
+"""
+Chrome DevTools Protocol client for Yisel Web
+Talks to Chrome directly over its remote debugging websocket
+"""
+
+import json
+import threading
+import itertools
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import requests
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+class CDPError(Exception):
+    """A CDP command returned an error"""
+
+class CDPConnectionError(CDPError):
+    """The DevTools websocket is unavailable"""
+
+class CDPTimeoutError(CDPError):
+    """A CDP command or event did not arrive in time"""
+
+class CDPClient:
+    """Pipelined CDP client with event subscriptions"""
+    
+    def __init__(self, port=9222, host='127.0.0.1', timeout=10):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.ws = None
+        self.target_id = None
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.listeners = {}
+        self.send_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.reader_thread = None
+        self.connected = False
+    
+    def list_targets(self):
+        """List the debuggable targets exposed by Chrome"""
+        try:
+            response = requests.get(f"http://{self.host}:{self.port}/json/list", timeout=self.timeout)
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise CDPConnectionError(f"DevTools endpoint unavailable: {e}")
+    
+    def connect(self, target_id=None):
+        """Connect to a page target, preferring the given target id"""
+        if websocket is None:
+            raise CDPConnectionError("websocket-client is not installed")
+        
+        pages = [t for t in self.list_targets() if t.get('type') == 'page']
+        target = next((t for t in pages if t.get('id') == target_id), pages[0] if pages else None)
+        if not target or not target.get('webSocketDebuggerUrl'):
+            raise CDPConnectionError("No debuggable page target found")
+        
+        try:
+            # Chrome rejects websocket handshakes carrying an unexpected Origin header
+            self.ws = websocket.create_connection(
+                target['webSocketDebuggerUrl'], timeout=self.timeout, suppress_origin=True
+            )
+        except Exception as e:
+            raise CDPConnectionError(f"DevTools websocket connection failed: {e}")
+        
+        self.ws.settimeout(None)
+        self.target_id = target['id']
+        self.connected = True
+        self.reader_thread = threading.Thread(target=self._read_loop)
+        self.reader_thread.daemon = True
+        self.reader_thread.start()
+        return True
+    
+    def _read_loop(self):
+        """Dispatch command responses and events as they arrive"""
+        while self.connected:
+            try:
+                message = json.loads(self.ws.recv())
+            except Exception as e:
+                if self.connected:
+                    print(f"DevTools connection lost: {e}")
+                break
+            
+            if 'id' in message:
+                with self.lock:
+                    future = self.pending.pop(message['id'], None)
+                if future:
+                    if 'error' in message:
+                        future.set_exception(CDPError(message['error'].get('message', 'CDP error')))
+                    else:
+                        future.set_result(message.get('result', {}))
+            elif 'method' in message:
+                with self.lock:
+                    callbacks = list(self.listeners.get(message['method'], ()))
+                for callback in callbacks:
+                    try:
+                        callback(message.get('params', {}))
+                    except Exception as e:
+                        print(f"CDP event handler error: {e}")
+        
+        self._fail_pending(CDPConnectionError("DevTools connection closed"))
+    
+    def _fail_pending(self, error):
+        """Fail every in-flight command"""
+        self.connected = False
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(error)
+    
+    def send(self, method, params=None):
+        """Send a command without waiting and return a future for its result"""
+        if not self.connected:
+            raise CDPConnectionError("DevTools websocket is not connected")
+        
+        command_id = next(self.ids)
+        future = Future()
+        with self.lock:
+            self.pending[command_id] = future
+        
+        try:
+            with self.send_lock:
+                self.ws.send(json.dumps({'id': command_id, 'method': method, 'params': params or {}}))
+        except Exception as e:
+            with self.lock:
+                self.pending.pop(command_id, None)
+            self._fail_pending(CDPConnectionError(f"DevTools send failed: {e}"))
+            raise CDPConnectionError(f"DevTools send failed: {e}")
+        return future
+    
+    def execute(self, method, params=None, timeout=None):
+        """Send a command and wait for its result"""
+        return self.result(self.send(method, params), timeout)
+    
+    def result(self, future, timeout=None):
+        """Wait for a command future"""
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            raise CDPTimeoutError("CDP command timed out")
+    
+    def execute_many(self, commands, timeout=None):
+        """Pipeline several (method, params) commands and return their results in order"""
+        futures = [self.send(method, params) for method, params in commands]
+        return [self.result(f, timeout) for f in futures]
+    
+    def on(self, event, callback):
+        """Subscribe to a CDP event"""
+        with self.lock:
+            self.listeners.setdefault(event, []).append(callback)
+    
+    def off(self, event, callback):
+        """Unsubscribe from a CDP event"""
+        with self.lock:
+            callbacks = self.listeners.get(event, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+    
+    def expect_event(self, event):
+        """Start listening for the next occurrence of an event; wait on the returned callable"""
+        fired = threading.Event()
+        payload = {}
+        
+        def handler(params):
+            payload.update(params)
+            fired.set()
+        
+        self.on(event, handler)
+        
+        def wait(timeout=None):
+            try:
+                if not fired.wait(timeout or self.timeout):
+                    raise CDPTimeoutError(f"Timed out waiting for {event}")
+                return payload
+            finally:
+                self.off(event, handler)
+        
+        # Callers that end up not waiting must cancel, or the handler stays registered
+        wait.cancel = lambda: self.off(event, handler)
+        return wait
+    
+    def close(self):
+        """Close the websocket"""
+        self.connected = False
+        if self.ws:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+            self.ws = None
+        self._fail_pending(CDPConnectionError("DevTools connection closed"))
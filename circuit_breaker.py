@@ -0,0 +1,166 @@
+"""
+Circuit Breaker for Yisel Web
+Stops calling an unhealthy dependency until it shows signs of recovery
+"""
+
+import time
+import threading
+from collections import deque
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by rolling error rate and latency"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_rate=0.5, slow_call_seconds=8.0, slow_call_rate=0.8,
+                 window_seconds=120, min_calls=4, open_seconds=60, half_open_calls=1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self.opened_at = 0
+        self.probes_in_flight = 0
+        self.outcomes = deque()
+        self.lock = threading.Lock()
+        self.listeners = []
+
+    def subscribe(self, callback):
+        """Call callback(name, old_state, new_state, stats) on every state change"""
+        self.listeners.append(callback)
+
+    def _set_state(self, state):
+        """Switch state and tell listeners; call with the lock held"""
+        old_state, self.state = self.state, state
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+        if state != self.HALF_OPEN:
+            self.probes_in_flight = 0
+        if state == self.CLOSED:
+            self.outcomes.clear()
+        return old_state
+
+    def _notify(self, old_state, new_state):
+        """Tell listeners about a state change; call without the lock held"""
+        if old_state == new_state:
+            return
+        stats = self.stats()
+        for callback in list(self.listeners):
+            try:
+                callback(self.name, old_state, new_state, stats)
+            except Exception as e:
+                print(f"Circuit breaker listener error: {e}")
+
+    def _trim(self, now):
+        """Drop outcomes that fell out of the rolling window"""
+        while self.outcomes and now - self.outcomes[0][0] > self.window_seconds:
+            self.outcomes.popleft()
+
+    def retry_after(self):
+        """Seconds until the open circuit lets a probe through"""
+        with self.lock:
+            if self.state != self.OPEN:
+                return 0
+            return max(0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def is_open(self):
+        """Check whether calls would currently be refused, without using up a probe"""
+        with self.lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at < self.open_seconds
+            if self.state == self.HALF_OPEN:
+                return self.probes_in_flight >= self.half_open_calls
+            return False
+
+    def allow_request(self):
+        """Check whether a call may go ahead, letting a throttled probe through after the cooldown"""
+        with self.lock:
+            old_state = self.state
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self._set_state(self.HALF_OPEN)
+
+            if self.state == self.HALF_OPEN:
+                if self.probes_in_flight >= self.half_open_calls:
+                    allowed = False
+                else:
+                    self.probes_in_flight += 1
+                    allowed = True
+            else:
+                allowed = True
+            new_state = self.state
+
+        self._notify(old_state, new_state)
+        return allowed
+
+    def record(self, success, duration=None):
+        """Record the outcome and latency of a call; a duration of None is never counted as slow"""
+        now = time.monotonic()
+        with self.lock:
+            old_state = self.state
+            slow = duration is not None and duration >= self.slow_call_seconds
+
+            if self.state == self.HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                self._set_state(self.CLOSED if success and not slow else self.OPEN)
+            else:
+                self.outcomes.append((now, success, slow))
+                self._trim(now)
+                if self.state == self.CLOSED and self._should_open():
+                    self._set_state(self.OPEN)
+            new_state = self.state
+
+        self._notify(old_state, new_state)
+
+    def _should_open(self):
+        """Check the rolling window against the thresholds; call with the lock held"""
+        total = len(self.outcomes)
+        if total < self.min_calls:
+            return False
+        failures = sum(1 for _, success, _ in self.outcomes if not success)
+        slow_calls = sum(1 for _, _, slow in self.outcomes if slow)
+        return failures / total >= self.failure_rate or slow_calls / total >= self.slow_call_rate
+
+    def call(self, func, *args, **kwargs):
+        """Call func through the breaker; exceptions and False results count as failures"""
+        if not self.allow_request():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+        start = time.monotonic()
+        success = False
+        try:
+            result = func(*args, **kwargs)
+            success = result is not False
+            return result
+        finally:
+            self.record(success, time.monotonic() - start)
+
+    def stats(self):
+        """Get the current state and rolling window counts"""
+        with self.lock:
+            self._trim(time.monotonic())
+            total = len(self.outcomes)
+            failures = sum(1 for _, success, _ in self.outcomes if not success)
+            slow_calls = sum(1 for _, _, slow in self.outcomes if slow)
+            return {
+                'name': self.name,
+                'state': self.state,
+                'calls': total,
+                'failure_rate': round(failures / total, 2) if total else 0.0,
+                'slow_call_rate': round(slow_calls / total, 2) if total else 0.0
+            }
@@ -0,0 +1,142 @@
+"""
+Socket.IO message queue backends for Yisel Web
+Lets every worker process deliver events to clients connected to any other worker
+"""
+
+import os
+import glob
+import json
+import stat
+import time
+import uuid
+import atexit
+import socket
+import socketio
+from blocking import run_blocking
+
+# Payload bytes per datagram; larger messages are split and reassembled by the receivers
+LOCAL_QUEUE_CHUNK_SIZE = 60000
+# Seconds to keep the parts of a message that never completes
+LOCAL_QUEUE_PARTIAL_TTL = 30
+
+class LocalSocketManager(socketio.PubSubManager):
+    """Single-host pub/sub over unix datagram sockets, one per worker process in a shared directory"""
+
+    name = 'local'
+
+    def __init__(self, path='/tmp/yisel-socketio', channel='flask-socketio', write_only=False, logger=None):
+        self.path = path
+        self.sock = None
+        self.partial = {}
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def initialize(self):
+        self._check_directory()
+        # Bind before the listener starts so this worker never misses its own first messages
+        if not self.write_only:
+            self._bind()
+            atexit.register(self.close)
+        super().initialize()
+
+    def _address(self):
+        """Path of this process's own socket"""
+        return os.path.join(self.path, f"{self.channel}-{self.host_id}.sock")
+
+    def _check_directory(self):
+        """Create the socket directory private to this user, refusing one that anybody else controls"""
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        info = os.lstat(self.path)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise RuntimeError(f"Socket.IO queue directory {self.path} must be a directory owned by this user with mode 0700")
+
+    def _bind(self):
+        """Create the socket this process receives on"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self._address())
+        # Wake up regularly so the receiving thread can notice shutdown
+        sock.settimeout(1)
+        self.sock = sock
+
+    def _publish(self, data):
+        """Send a message to every worker on the channel, including this one"""
+        # JSON rather than pickle, so a datagram can never run code in the receiver
+        payload = json.dumps(data, default=str).encode('utf-8')
+        message_id = uuid.uuid4().hex
+        chunks = [payload[i:i + LOCAL_QUEUE_CHUNK_SIZE] for i in range(0, len(payload), LOCAL_QUEUE_CHUNK_SIZE)] or [b'']
+        datagrams = [f"{message_id} {index} {len(chunks)}\n".encode('ascii') + chunk for index, chunk in enumerate(chunks)]
+
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for address in glob.glob(os.path.join(self.path, f"{self.channel}-*.sock")):
+                try:
+                    for datagram in datagrams:
+                        sender.sendto(datagram, address)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # The worker that owned this socket has exited
+                    try:
+                        os.unlink(address)
+                    except OSError:
+                        pass
+                except OSError as e:
+                    print(f"Socket.IO queue publish to {address} failed: {e}")
+        finally:
+            sender.close()
+
+    def _listen(self):
+        """Yield messages published by any worker"""
+        while self.sock:
+            # recv blocks, so keep it off the eventlet hub
+            datagram = run_blocking(self._receive)
+            if datagram is None:
+                continue
+            try:
+                message = self._assemble(datagram)
+            except (ValueError, IndexError) as e:
+                print(f"Socket.IO queue dropped a malformed message: {e}")
+                continue
+            if message is not None:
+                yield message
+
+    def _receive(self):
+        """Wait briefly for one datagram"""
+        try:
+            return self.sock.recv(1 << 20)
+        except (socket.timeout, AttributeError, OSError):
+            return None
+
+    def _assemble(self, datagram):
+        """Decode a datagram, returning the message once all of its parts have arrived"""
+        header, _, chunk = datagram.partition(b'\n')
+        message_id, index, count = header.decode('ascii').split(' ')
+        index, count = int(index), int(count)
+        if count == 1:
+            return json.loads(chunk)
+
+        now = time.monotonic()
+        for stale in [key for key, entry in self.partial.items() if now - entry['started'] > LOCAL_QUEUE_PARTIAL_TTL]:
+            del self.partial[stale]
+        entry = self.partial.setdefault(message_id, {'started': now, 'chunks': [None] * count})
+        entry['chunks'][index] = chunk
+        if any(part is None for part in entry['chunks']):
+            return None
+        del self.partial[message_id]
+        return json.loads(b''.join(entry['chunks']))
+
+    def close(self):
+        """Stop receiving and remove this process's socket"""
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        try:
+            os.unlink(self._address())
+        except OSError:
+            pass
+
+def socketio_queue_options(url):
+    """SocketIO keyword arguments for a message queue URL (redis://, local:///path, or None for a single process)"""
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        return {'client_manager': LocalSocketManager(url[len('local://'):] or '/tmp/yisel-socketio')}
+    # Flask-SocketIO picks the Redis, Kafka, ZeroMQ or Kombu backend from the URL scheme
+    return {'message_queue': url}
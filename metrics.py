@@ -0,0 +1,323 @@
+"""
+Metrics for Yisel Web
+One sampler thread feeding fixed-size time-series buffers with downsampled rollups,
+plus Prometheus counters and histograms for requests, tasks, browser operations and notifications
+"""
+
+import os
+import math
+import time
+import atexit
+import functools
+import threading
+from array import array
+import psutil
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+
+# Sampling and retention
+METRICS_SAMPLE_INTERVAL = float(os.environ.get('METRICS_SAMPLE_INTERVAL', '5'))
+METRICS_HISTORY_SIZE = int(os.environ.get('METRICS_HISTORY_SIZE', '720'))
+# Comma-separated bucket_seconds:capacity pairs; default keeps a day of 1-minute and a week of 15-minute averages
+METRICS_ROLLUPS = os.environ.get('METRICS_ROLLUPS', '60:1440,900:672')
+SYSTEM_CHECK_INTERVAL = float(os.environ.get('SYSTEM_CHECK_INTERVAL', '60'))
+# Shared directory where every worker process writes its Prometheus samples; empty it before starting the server
+PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+METRIC_FIELDS = (
+    'cpu_percent',
+    'memory_percent',
+    'battery_percent',
+    'browser_connected',
+    'chrome_rss_mb',
+    'chrome_processes',
+    'tasks_due',
+    'jobs_queued',
+    'notifications_queued'
+)
+
+def parse_rollups(spec):
+    """Parse 'seconds:capacity,...' into a list of (seconds, capacity)"""
+    rollups = []
+    for part in spec.split(','):
+        if ':' in part:
+            seconds, capacity = part.split(':', 1)
+            rollups.append((int(seconds), int(capacity)))
+    return rollups
+
+class TimeSeriesRing:
+    """Fixed-capacity time series kept in flat float arrays; missing values are NaN"""
+    
+    def __init__(self, fields, capacity):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.timestamps = array('d', [0.0]) * capacity
+        self.columns = {field: array('d', [math.nan]) * capacity for field in self.fields}
+        self.next = 0
+        self.size = 0
+    
+    def append(self, timestamp, values):
+        """Write one point over the oldest slot"""
+        index = self.next
+        self.timestamps[index] = timestamp
+        for field in self.fields:
+            value = values.get(field)
+            self.columns[field][index] = math.nan if value is None else float(value)
+        self.next = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+    
+    def query(self, since=None, fields=None):
+        """Points newer than since, oldest first, as {'timestamps': [...], 'series': {field: [...]}}"""
+        fields = [field for field in (fields or self.fields) if field in self.columns]
+        start = (self.next - self.size) % self.capacity
+        indexes = [(start + offset) % self.capacity for offset in range(self.size)]
+        if since is not None:
+            indexes = [index for index in indexes if self.timestamps[index] > since]
+        
+        series = {}
+        for field in fields:
+            column = self.columns[field]
+            series[field] = [None if math.isnan(column[index]) else round(column[index], 2) for index in indexes]
+        return {'timestamps': [self.timestamps[index] for index in indexes], 'series': series}
+
+class MetricsHistory:
+    """Raw samples plus averaged rollups at coarser resolutions"""
+    
+    def __init__(self, fields=METRIC_FIELDS, capacity=METRICS_HISTORY_SIZE, rollups=None):
+        self.fields = tuple(fields)
+        self.raw = TimeSeriesRing(self.fields, capacity)
+        self.rollups = {}
+        for seconds, rollup_capacity in (rollups if rollups is not None else parse_rollups(METRICS_ROLLUPS)):
+            self.rollups[seconds] = {
+                'ring': TimeSeriesRing(self.fields, rollup_capacity),
+                'bucket': None,
+                'sums': dict.fromkeys(self.fields, 0.0),
+                'counts': dict.fromkeys(self.fields, 0)
+            }
+        self.lock = threading.Lock()
+    
+    def add(self, timestamp, values):
+        """Record a sample and fold it into each rollup bucket"""
+        with self.lock:
+            self.raw.append(timestamp, values)
+            for seconds, rollup in self.rollups.items():
+                bucket = int(timestamp // seconds)
+                if rollup['bucket'] is not None and bucket != rollup['bucket']:
+                    self._flush(seconds, rollup)
+                rollup['bucket'] = bucket
+                for field in self.fields:
+                    value = values.get(field)
+                    if value is not None:
+                        rollup['sums'][field] += float(value)
+                        rollup['counts'][field] += 1
+    
+    def _flush(self, seconds, rollup):
+        """Close a rollup bucket as one averaged point; call with the lock held"""
+        averages = {
+            field: rollup['sums'][field] / rollup['counts'][field]
+            for field in self.fields if rollup['counts'][field]
+        }
+        rollup['ring'].append(rollup['bucket'] * seconds, averages)
+        rollup['sums'] = dict.fromkeys(self.fields, 0.0)
+        rollup['counts'] = dict.fromkeys(self.fields, 0)
+    
+    def resolutions(self):
+        """Available resolutions: 'raw' plus rollup bucket sizes in seconds"""
+        return ['raw'] + sorted(self.rollups)
+    
+    def query(self, resolution='raw', since=None, fields=None):
+        """Get a resolution's points newer than since"""
+        with self.lock:
+            if resolution in (None, 'raw'):
+                return self.raw.query(since, fields)
+            rollup = self.rollups.get(int(resolution))
+            if rollup is None:
+                raise ValueError(f"Unknown resolution: {resolution}")
+            return rollup['ring'].query(since, fields)
+
+class SystemSampler:
+    """Single background sampler for system, browser and queue metrics"""
+    
+    def __init__(self, history=None, interval=METRICS_SAMPLE_INTERVAL):
+        self.history = history or MetricsHistory()
+        self.interval = interval
+        # [func, interval, last_run, last_values]
+        self.collectors = []
+        # [callback, interval, last_called]
+        self.listeners = []
+        self.latest = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+    
+    def add_collector(self, func, interval=None):
+        """Add func() -> dict of metric values, run at most every interval seconds"""
+        with self.lock:
+            self.collectors.append([func, interval or self.interval, 0, {}])
+    
+    def subscribe(self, callback, interval=None):
+        """Call callback(sample) after samples, at most every interval seconds"""
+        with self.lock:
+            self.listeners.append([callback, interval or self.interval, 0])
+    
+    def unsubscribe(self, callback):
+        """Stop calling a subscriber"""
+        with self.lock:
+            self.listeners = [listener for listener in self.listeners if listener[0] != callback]
+    
+    def start(self):
+        """Start the sampler thread"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        # The first non-blocking cpu_percent call only sets the baseline for the next one
+        psutil.cpu_percent(interval=None)
+        self.thread = threading.Thread(target=self._loop, name='system-sampler')
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def stop(self):
+        """Stop the sampler thread"""
+        self.stop_event.set()
+    
+    def _loop(self):
+        """Sample until stopped"""
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Metrics sampler error: {e}")
+    
+    def _system(self):
+        """Host metrics; cpu_percent is the delta since the previous call, so nothing blocks"""
+        battery = psutil.sensors_battery()
+        return {
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory_percent': psutil.virtual_memory().percent,
+            'battery_percent': battery.percent if battery else None
+        }
+    
+    def sample(self):
+        """Take one sample, store it and notify due subscribers"""
+        now = time.monotonic()
+        values = self._system()
+        
+        with self.lock:
+            collectors = list(self.collectors)
+        for collector in collectors:
+            func, interval, last_run, last_values = collector
+            if now - last_run >= interval:
+                try:
+                    collector[3] = func() or {}
+                except Exception as e:
+                    print(f"Metrics collector error: {e}")
+                    collector[3] = {}
+                collector[2] = now
+            values.update(collector[3])
+        
+        self.history.add(time.time(), values)
+        self.latest = values
+        
+        with self.lock:
+            due = [listener for listener in self.listeners if now - listener[2] >= listener[1]]
+            for listener in due:
+                listener[2] = now
+        for callback, _, _ in due:
+            try:
+                callback(values)
+            except Exception as e:
+                print(f"Metrics subscriber error: {e}")
+        return values
+
+# Prometheus instruments
+HTTP_REQUESTS = Counter(
+    'yisel_http_requests_total', 'HTTP requests by route and status',
+    ['method', 'route', 'status']
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'yisel_http_request_duration_seconds', 'HTTP request latency by route',
+    ['method', 'route'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+TASK_SECONDS = Histogram(
+    'yisel_task_duration_seconds', 'Scheduled task executions by type and outcome',
+    ['task_type', 'outcome'],
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+)
+ENGINE_OPERATION_SECONDS = Histogram(
+    'yisel_engine_operation_duration_seconds', 'Browser automation operations by name and outcome',
+    ['operation', 'outcome'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 60, 120)
+)
+NOTIFICATION_DELIVERIES = Counter(
+    'yisel_notification_deliveries_total', 'Notification deliveries by channel and outcome',
+    ['channel', 'outcome']
+)
+NOTIFICATION_DELIVERY_SECONDS = Histogram(
+    'yisel_notification_delivery_duration_seconds', 'Notification delivery latency by channel',
+    ['channel'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+# Sampled values exported as gauges; per-process queues add up across workers, host readings don't
+SAMPLE_GAUGES = {
+    field: Gauge(
+        f'yisel_{field}', f'Latest sampled {field.replace("_", " ")}',
+        multiprocess_mode='livesum' if field in ('jobs_queued', 'notifications_queued') else 'livemax'
+    )
+    for field in METRIC_FIELDS
+}
+
+_timing = threading.local()
+
+def timed_operation(name):
+    """Record a browser operation's duration; nested calls of the same operation are timed once"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            active = getattr(_timing, 'operations', None)
+            if active is None:
+                active = _timing.operations = set()
+            if name in active:
+                return method(*args, **kwargs)
+            
+            active.add(name)
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = method(*args, **kwargs)
+                outcome = 'failure' if result is False else 'success'
+                return result
+            finally:
+                active.discard(name)
+                ENGINE_OPERATION_SECONDS.labels(name, outcome).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def record_delivery(channel, succeeded, seconds=None):
+    """Count a notification delivery and its latency"""
+    NOTIFICATION_DELIVERIES.labels(channel, 'success' if succeeded else 'failure').inc()
+    if seconds is not None:
+        NOTIFICATION_DELIVERY_SECONDS.labels(channel).observe(seconds)
+
+def export_sample(sample):
+    """Copy a sampler reading into the Prometheus gauges"""
+    for field, gauge in SAMPLE_GAUGES.items():
+        value = sample.get(field)
+        if value is not None:
+            gauge.set(float(value))
+
+def render_prometheus():
+    """Prometheus text exposition for this process, or for all workers in multiprocess mode"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def mark_process_dead():
+    """Drop this worker's live gauges so they stop counting toward the totals"""
+    multiprocess.mark_process_dead(os.getpid())
+
+if PROMETHEUS_MULTIPROC_DIR:
+    atexit.register(mark_process_dead)
@@ -3,20 +3,325 @@ Notification System for Yisel Web
 Handles real-time notifications, alerts, and communication
 """
 
+import os
 import requests
 import json
 import datetime
 import threading
 import time
-from flask_socketio import emit
+import heapq
+import bisect
+import itertools
+from collections import deque
+from alert_actions import ActionDispatcher
+from metrics import SYSTEM_CHECK_INTERVAL, record_delivery
+
+# Notification retention (in-memory ring buffers)
+NOTIFICATION_USER_LIMIT = int(os.environ.get('NOTIFICATION_USER_LIMIT', '200'))
+NOTIFICATION_GLOBAL_LIMIT = int(os.environ.get('NOTIFICATION_GLOBAL_LIMIT', '1000'))
+
+# ntfy delivery
+NTFY_BASE_URL = os.environ.get('NTFY_BASE_URL', 'https://ntfy.sh').rstrip('/')
+NTFY_WORKERS = int(os.environ.get('NTFY_WORKERS', '2'))
+NTFY_MAX_RETRIES = int(os.environ.get('NTFY_MAX_RETRIES', '3'))
+NTFY_RETRY_BACKOFF = float(os.environ.get('NTFY_RETRY_BACKOFF', '2'))
+NTFY_COALESCE_SECONDS = float(os.environ.get('NTFY_COALESCE_SECONDS', '2'))
+NTFY_QUEUE_LIMIT = int(os.environ.get('NTFY_QUEUE_LIMIT', '500'))
+
+# Socket.IO fan-out
+SOCKET_BATCH_WINDOW = float(os.environ.get('SOCKET_BATCH_WINDOW', '0.25'))
+SOCKET_CHANNELS = ('notifications', 'tasks', 'jobs', 'system')
+
+# Alert suppression
+ALERT_COOLDOWN_SECONDS = float(os.environ.get('ALERT_COOLDOWN_SECONDS', '900'))
+ALERT_BURST_WINDOW = float(os.environ.get('ALERT_BURST_WINDOW', '300'))
+ALERT_BURST_LIMIT = int(os.environ.get('ALERT_BURST_LIMIT', '3'))
+
+def channel_room(channel):
+    """Name of the Socket.IO room for clients subscribed to a channel"""
+    return f"channel:{channel}"
+
+class SocketEventBatcher:
+    """Coalesces Socket.IO events per room and sends each room one frame per window"""
+    
+    def __init__(self, socketio, window=SOCKET_BATCH_WINDOW):
+        self.socketio = socketio
+        self.window = window
+        # room -> {'due': monotonic time, 'events': {key: (event, data)}}; dicts keep insertion order
+        self.pending = {}
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._flush_loop, name='socket-batcher')
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def emit(self, event, data, room, key=None):
+        """Queue an event for a room; a later event with the same key replaces the queued one"""
+        with self.condition:
+            batch = self.pending.get(room)
+            if batch is None:
+                batch = {'due': time.monotonic() + self.window, 'events': {}}
+                self.pending[room] = batch
+                self.condition.notify()
+            if key is None:
+                key = next(self.sequence)
+            else:
+                batch['events'].pop((event, key), None)
+                key = (event, key)
+            batch['events'][key] = (event, data)
+    
+    def _flush_loop(self):
+        """Send each room's batch once its window closes"""
+        while self.running:
+            with self.condition:
+                now = time.monotonic()
+                due = [room for room, batch in self.pending.items() if batch['due'] <= now]
+                batches = [(room, self.pending.pop(room)['events'].values()) for room in due]
+                if not batches:
+                    next_due = min((batch['due'] for batch in self.pending.values()), default=None)
+                    self.condition.wait(None if next_due is None else max(0, next_due - now))
+                    continue
+            
+            for room, events in batches:
+                self._send(room, list(events))
+    
+    def _send(self, room, events):
+        """Send queued events to a room, as a single frame when there are several"""
+        start = time.perf_counter()
+        try:
+            if len(events) == 1:
+                event, data = events[0]
+                self.socketio.emit(event, data, to=room)
+            else:
+                self.socketio.emit('batch', {
+                    'events': [{'event': event, 'data': data} for event, data in events]
+                }, to=room)
+            record_delivery('socket', True, time.perf_counter() - start)
+        except Exception as e:
+            print(f"Socket batch emit failed: {e}")
+            record_delivery('socket', False, time.perf_counter() - start)
+    
+    def stop(self):
+        """Stop the flush thread"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join(timeout=5)
+
+class _Entry:
+    """A stored notification with its insertion sequence number"""
+    
+    __slots__ = ('seq', 'notification', 'cleared')
+    
+    def __init__(self, seq, notification):
+        self.seq = seq
+        self.notification = notification
+        self.cleared = False
+
+class NtfyDeliveryQueue:
+    """Delivers ntfy messages from background workers, coalescing bursts per topic"""
+    
+    def __init__(self, base_url=NTFY_BASE_URL, workers=NTFY_WORKERS, max_retries=NTFY_MAX_RETRIES,
+                 retry_backoff=NTFY_RETRY_BACKOFF, coalesce_seconds=NTFY_COALESCE_SECONDS,
+                 queue_limit=NTFY_QUEUE_LIMIT):
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.coalesce_seconds = coalesce_seconds
+        self.queue_limit = queue_limit
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # topic -> {'due': monotonic time, 'attempt': n, 'messages': [(title, message), ...]}
+        self.pending = {}
+        self.queued = 0
+        self.condition = threading.Condition()
+        self.running = True
+        self.threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f'ntfy-{index}')
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+    
+    def enqueue(self, topic, title, message):
+        """Queue a message; messages for the same topic within the coalesce window go out together"""
+        with self.condition:
+            if self.queued >= self.queue_limit:
+                print(f"ntfy queue full, dropping notification for {topic}")
+                return False
+            batch = self.pending.get(topic)
+            if batch is None:
+                batch = {'due': time.monotonic() + self.coalesce_seconds, 'attempt': 0, 'messages': []}
+                self.pending[topic] = batch
+            batch['messages'].append((title, message))
+            self.queued += 1
+            self.condition.notify()
+        return True
+    
+    def _next_batch(self):
+        """Wait for the earliest due topic and take it; call with the condition held"""
+        while self.running:
+            if not self.pending:
+                self.condition.wait()
+                continue
+            topic = min(self.pending, key=lambda t: self.pending[t]['due'])
+            delay = self.pending[topic]['due'] - time.monotonic()
+            if delay > 0:
+                self.condition.wait(delay)
+                continue
+            batch = self.pending.pop(topic)
+            self.queued -= len(batch['messages'])
+            return topic, batch
+        return None, None
+    
+    def _worker(self):
+        """Deliver due batches until stopped"""
+        while self.running:
+            with self.condition:
+                topic, batch = self._next_batch()
+            if topic is None:
+                break
+            
+            if self.deliver(topic, *self._combine(batch['messages'])):
+                continue
+            
+            attempt = batch['attempt'] + 1
+            if attempt > self.max_retries:
+                print(f"Giving up on ntfy notification for {topic} after {attempt} attempts")
+                continue
+            
+            # Retry later, folding in anything queued for the topic meanwhile
+            with self.condition:
+                retry = self.pending.pop(topic, None)
+                messages = batch['messages'] + (retry['messages'] if retry else [])
+                self.pending[topic] = {
+                    'due': time.monotonic() + self.retry_backoff * 2 ** (attempt - 1),
+                    'attempt': attempt,
+                    'messages': messages
+                }
+                self.queued += len(batch['messages'])
+                self.condition.notify()
+    
+    def _combine(self, messages):
+        """Collapse a burst of messages into one title and body"""
+        if len(messages) == 1:
+            return messages[0]
+        return f"{len(messages)} notifications", '\n'.join(f"{title}: {message}" for title, message in messages)
+    
+    def deliver(self, topic, title, message):
+        """Post one message to ntfy; True when delivered or not worth retrying"""
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                f"{self.base_url}/{topic}",
+                data=message.encode('utf-8'),
+                headers={
+                    'Title': title,
+                    'Priority': 'default',
+                    'Tags': 'medical,yisel'
+                },
+                timeout=10
+            )
+        except requests.RequestException as e:
+            print(f"Failed to send ntfy notification: {e}")
+            record_delivery('ntfy', False, time.perf_counter() - start)
+            return False
+        
+        record_delivery('ntfy', response.status_code == 200, time.perf_counter() - start)
+        if response.status_code == 429 or response.status_code >= 500:
+            print(f"ntfy returned {response.status_code} for {topic}, will retry")
+            return False
+        if response.status_code != 200:
+            print(f"ntfy rejected notification for {topic}: {response.status_code}")
+        return True
+    
+    def stop(self, timeout=5):
+        """Stop the workers"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        self.session.close()
+
+class AlertSuppressor:
+    """Deduplicates repeating alerts by fingerprint and folds bursts of events into summaries"""
+    
+    def __init__(self, cooldown=ALERT_COOLDOWN_SECONDS, burst_window=ALERT_BURST_WINDOW, burst_limit=ALERT_BURST_LIMIT):
+        self.cooldown = cooldown
+        self.burst_window = burst_window
+        self.burst_limit = burst_limit
+        # fingerprint -> {'sent_at': monotonic time, 'suppressed': n}
+        self.active = {}
+        # category -> {'count': n, 'suppressed': n}
+        self.bursts = {}
+        self.lock = threading.Lock()
+    
+    def allow(self, fingerprint, cooldown=None):
+        """Return None to suppress a repeat, or how many repeats were suppressed since it was last sent"""
+        cooldown = self.cooldown if cooldown is None else cooldown
+        now = time.monotonic()
+        with self.lock:
+            alert = self.active.get(fingerprint)
+            if alert and now - alert['sent_at'] < cooldown:
+                alert['suppressed'] += 1
+                return None
+            self.active[fingerprint] = {'sent_at': now, 'suppressed': 0}
+            return alert['suppressed'] if alert else 0
+    
+    def resolve(self, fingerprint):
+        """Forget an alert; True when it was active and deserves a recovery notice"""
+        with self.lock:
+            return self.active.pop(fingerprint, None) is not None
+    
+    def burst(self, category, on_summary):
+        """Count an event; True to send it individually, False when it will be folded into on_summary(count, window)"""
+        with self.lock:
+            burst = self.bursts.get(category)
+            if burst is None:
+                burst = {'count': 0, 'suppressed': 0}
+                self.bursts[category] = burst
+                timer = threading.Timer(self.burst_window, self._close_burst, (category, on_summary))
+                timer.daemon = True
+                timer.start()
+            burst['count'] += 1
+            if burst['count'] <= self.burst_limit:
+                return True
+            burst['suppressed'] += 1
+            return False
+    
+    def _close_burst(self, category, on_summary):
+        """Send the summary for a burst that had events folded into it"""
+        with self.lock:
+            burst = self.bursts.pop(category, None)
+        if burst and burst['suppressed']:
+            try:
+                on_summary(burst['count'], self.burst_window)
+            except Exception as e:
+                print(f"Alert burst summary failed: {e}")
 
 class NotificationManager:
     """Manages notifications and alerts"""
     
-    def __init__(self, socketio):
+    def __init__(self, socketio, user_limit=NOTIFICATION_USER_LIMIT, global_limit=NOTIFICATION_GLOBAL_LIMIT,
+                 ntfy_queue=None, store=None, batcher=None, suppressor=None):
         self.socketio = socketio
+        self.batcher = batcher
+        self.suppressor = suppressor or AlertSuppressor()
         self.notification_topics = {}
-        self.active_notifications = []
+        self.ntfy_queue = ntfy_queue or NtfyDeliveryQueue()
+        # With a persistent store, it owns history; otherwise the ring buffers below do
+        self.store = store
+        self.user_limit = user_limit
+        # Entries are appended in time order, so every buffer is already sorted oldest to newest
+        self.notifications = deque(maxlen=global_limit)
+        self.user_notifications = {}
+        self.broadcasts = deque(maxlen=user_limit)
+        self.sequence = itertools.count(1)
+        self.lock = threading.Lock()
     
     def add_notification_topic(self, user_id, topic):
         """Add a notification topic for a user"""
@@ -25,7 +330,6 @@ class NotificationManager:
     def send_notification(self, user_id, title, message, notification_type='info'):
         """Send a notification to a specific user"""
         notification = {
-            'id': f"notif_{int(time.time())}",
             'title': title,
             'message': message,
             'type': notification_type,
@@ -34,10 +338,10 @@ class NotificationManager:
         }
         
         # Store notification
-        self.active_notifications.append(notification)
+        self._store(notification, user_id)
         
         # Send via WebSocket
-        self.socketio.emit('notification', notification, room=user_id)
+        self._emit(notification, user_id)
         
         # Send via ntfy.sh if configured
         if user_id in self.notification_topics:
@@ -46,25 +350,12 @@ class NotificationManager:
         return notification
     
     def send_ntfy_notification(self, topic, title, message):
-        """Send notification via ntfy.sh"""
-        try:
-            url = f"https://ntfy.sh/{topic}"
-            headers = {
-                'Title': title,
-                'Priority': 'default',
-                'Tags': 'medical,yisel'
-            }
-            
-            response = requests.post(url, data=message, headers=headers, timeout=10)
-            return response.status_code == 200
-        except Exception as e:
-            print(f"Failed to send ntfy notification: {e}")
-            return False
+        """Queue a notification for background delivery via ntfy"""
+        return self.ntfy_queue.enqueue(topic, title, message)
     
     def broadcast_notification(self, title, message, notification_type='info'):
         """Broadcast notification to all connected users"""
         notification = {
-            'id': f"broadcast_{int(time.time())}",
             'title': title,
             'message': message,
             'type': notification_type,
@@ -72,74 +363,161 @@ class NotificationManager:
             'broadcast': True
         }
         
-        self.active_notifications.append(notification)
-        self.socketio.emit('notification', notification, broadcast=True)
+        self._store(notification)
+        self._emit(notification, channel_room('notifications'))
         
         return notification
     
-    def get_notifications(self, user_id=None, limit=50):
-        """Get recent notifications"""
+    def send_alert(self, key, title, message, notification_type='warning', user_id=None, cooldown=None):
+        """Send an alert unless the same one was sent within its cooldown"""
+        suppressed = self.suppressor.allow(key, cooldown)
+        if suppressed is None:
+            return None
+        if suppressed:
+            message = f"{message} ({suppressed} repeats suppressed)"
         if user_id:
-            notifications = [n for n in self.active_notifications 
-                           if n.get('user_id') == user_id or n.get('broadcast')]
+            return self.send_notification(user_id, title, message, notification_type)
+        return self.broadcast_notification(title, message, notification_type)
+    
+    def resolve_alert(self, key, title, message, user_id=None):
+        """Send a recovery notice if the alert was active"""
+        if not self.suppressor.resolve(key):
+            return None
+        if user_id:
+            return self.send_notification(user_id, title, message, 'success')
+        return self.broadcast_notification(title, message, 'success')
+    
+    def _emit(self, notification, room):
+        """Send a notification to a room, batched when a batcher is configured"""
+        if self.batcher:
+            self.batcher.emit('notification', notification, room)
         else:
-            notifications = self.active_notifications
+            self.socketio.emit('notification', notification, to=room)
+            record_delivery('socket', True)
+    
+    def _store(self, notification, user_id=None):
+        """Record a notification and give it a monotonic id"""
+        if self.store:
+            notification['id'] = self.store.save(notification, user_id)
+            return
+        
+        with self.lock:
+            entry = _Entry(next(self.sequence), notification)
+            notification['id'] = entry.seq
+            self.notifications.append(entry)
+            if user_id is None:
+                index = self.broadcasts
+            else:
+                if user_id not in self.user_notifications:
+                    self.user_notifications[user_id] = deque(maxlen=self.user_limit)
+                index = self.user_notifications[user_id]
+            # An entry pushed out of its per-user index is gone from every view
+            if len(index) == index.maxlen:
+                index[0].cleared = True
+            index.append(entry)
+            if entry.seq % 100 == 0:
+                self._prune_users()
+    
+    def _prune_users(self):
+        """Drop user indexes whose entries have all left the global buffer; call with the lock held"""
+        oldest = self.notifications[0].seq
+        stale = [user_id for user_id, entries in self.user_notifications.items()
+                 if not entries or entries[-1].seq < oldest]
+        for user_id in stale:
+            del self.user_notifications[user_id]
+    
+    def _live(self, entries):
+        """Iterate entries newest first, skipping cleared ones and ones evicted from the global buffer"""
+        oldest = self.notifications[0].seq if self.notifications else 0
+        for entry in reversed(entries):
+            if entry.seq < oldest:
+                break
+            if not entry.cleared:
+                yield entry
+    
+    def get_notifications(self, user_id=None, limit=50, since=None):
+        """Get recent notifications newest first, or those after the since id oldest first"""
+        if self.store:
+            return self.store.load(user_id, limit, since)
         
-        return sorted(notifications, key=lambda x: x['timestamp'], reverse=True)[:limit]
+        with self.lock:
+            if since is not None:
+                delta = []
+                for entry in self._live(self.notifications):
+                    if entry.seq <= since:
+                        break
+                    if not user_id or entry.notification.get('user_id') in (user_id, None):
+                        delta.append(entry.notification)
+                return delta[::-1][:limit]
+
+            if user_id:
+                entries = heapq.merge(
+                    self._live(self.user_notifications.get(user_id, ())),
+                    self._live(self.broadcasts),
+                    key=lambda entry: entry.seq,
+                    reverse=True
+                )
+            else:
+                entries = self._live(self.notifications)
+            return [entry.notification for entry in itertools.islice(entries, limit)]
     
     def clear_notifications(self, user_id=None):
         """Clear notifications"""
-        if user_id:
-            self.active_notifications = [n for n in self.active_notifications 
-                                       if n.get('user_id') != user_id and not n.get('broadcast')]
-        else:
-            self.active_notifications = []
+        if self.store:
+            self.store.clear(user_id)
+            return
+        
+        with self.lock:
+            if user_id:
+                for entry in itertools.chain(self.user_notifications.pop(user_id, ()), self.broadcasts):
+                    entry.cleared = True
+                self.broadcasts.clear()
+            else:
+                self.notifications.clear()
+                self.user_notifications.clear()
+                self.broadcasts.clear()
 
 class SystemMonitor:
-    """Monitors system status and sends alerts"""
+    """Turns system samples into alerts and notifications"""
     
-    def __init__(self, notification_manager, automation_engine):
+    def __init__(self, notification_manager, automation_engine, alert_system=None, sampler=None):
         self.notification_manager = notification_manager
         self.automation_engine = automation_engine
+        self.alert_system = alert_system
+        self.sampler = sampler
         self.monitoring = False
-        self.monitor_thread = None
     
     def start_monitoring(self):
         """Start system monitoring"""
         if not self.monitoring:
             self.monitoring = True
-            self.monitor_thread = threading.Thread(target=self._monitor_loop)
-            self.monitor_thread.daemon = True
-            self.monitor_thread.start()
+            self.sampler.subscribe(self.check_sample, SYSTEM_CHECK_INTERVAL)
     
     def stop_monitoring(self):
         """Stop system monitoring"""
         self.monitoring = False
-        if self.monitor_thread:
-            self.monitor_thread.join(timeout=5)
+        self.sampler.unsubscribe(self.check_sample)
     
-    def _monitor_loop(self):
-        """Main monitoring loop"""
-        while self.monitoring:
-            try:
-                # Check browser connection
-                self._check_browser_connection()
-                
-                # Check battery level
-                self._check_battery_level()
-                
-                # Check system resources
-                self._check_system_resources()
-                
-                time.sleep(60)  # Check every minute
-            except Exception as e:
-                print(f"Monitor error: {e}")
-                time.sleep(60)
+    def check_sample(self, sample):
+        """Check one sample from the system sampler"""
+        try:
+            # Check browser connection
+            if sample.get('browser_connected') is not None:
+                self._check_browser_connection(sample['browser_connected'])
+            
+            # Check battery level
+            self._check_battery_level(sample.get('battery_percent'))
+            
+            # Check system resources
+            self._check_system_resources(sample['memory_percent'], sample['cpu_percent'])
+        except Exception as e:
+            print(f"Monitor error: {e}")
     
-    def _check_browser_connection(self):
+    def _check_browser_connection(self, is_connected):
         """Check browser connection status"""
         try:
-            is_connected = self.automation_engine.check_connection()
+            if self.alert_system:
+                self.alert_system.record_browser(is_connected)
             
             # Store previous state to detect changes
             if not hasattr(self, '_prev_browser_state'):
@@ -164,47 +542,54 @@ class SystemMonitor:
         except Exception as e:
             print(f"Browser check error: {e}")
     
-    def _check_battery_level(self):
+    def _check_battery_level(self, battery_percent):
         """Check system battery level"""
         try:
-            import psutil
-            battery = psutil.sensors_battery()
-            
-            if battery and battery.percent < 20:
-                if not hasattr(self, '_battery_warning_sent') or not self._battery_warning_sent:
-                    self.notification_manager.broadcast_notification(
-                        "Low Battery Warning",
-                        f"System battery is at {battery.percent}%. Please connect to power.",
-                        "warning"
-                    )
-                    self._battery_warning_sent = True
-            else:
-                self._battery_warning_sent = False
+            if battery_percent is not None and battery_percent < 20:
+                self.notification_manager.send_alert(
+                    'battery',
+                    "Low Battery Warning",
+                    f"System battery is at {battery_percent}%. Please connect to power.",
+                    "warning"
+                )
+            elif battery_percent is not None:
+                self.notification_manager.resolve_alert(
+                    'battery', "Battery Recovered", f"System battery is at {battery_percent}%"
+                )
         except Exception as e:
             print(f"Battery check error: {e}")
     
-    def _check_system_resources(self):
+    def _check_system_resources(self, memory_percent, cpu_percent):
         """Check system resource usage"""
         try:
-            import psutil
+            if self.alert_system:
+                self.alert_system.check_alerts({'memory_usage': memory_percent, 'cpu_usage': cpu_percent})
             
             # Check memory usage
-            memory = psutil.virtual_memory()
-            if memory.percent > 90:
-                self.notification_manager.broadcast_notification(
+            if memory_percent > 90:
+                self.notification_manager.send_alert(
+                    'memory',
                     "High Memory Usage",
-                    f"System memory usage is at {memory.percent}%",
+                    f"System memory usage is at {memory_percent}%",
                     "warning"
                 )
+            else:
+                self.notification_manager.resolve_alert(
+                    'memory', "Memory Usage Normal", f"System memory usage is back to {memory_percent}%"
+                )
             
             # Check CPU usage
-            cpu_percent = psutil.cpu_percent(interval=1)
             if cpu_percent > 95:
-                self.notification_manager.broadcast_notification(
+                self.notification_manager.send_alert(
+                    'cpu',
                     "High CPU Usage",
                     f"System CPU usage is at {cpu_percent}%",
                     "warning"
                 )
+            else:
+                self.notification_manager.resolve_alert(
+                    'cpu', "CPU Usage Normal", f"System CPU usage is back to {cpu_percent}%"
+                )
         except Exception as e:
             print(f"Resource check error: {e}")
 
@@ -223,6 +608,15 @@ class TaskNotificationHandler:
             "info"
         )
     
+    def notify_tasks_scheduled(self, user_id, count, first_run, last_run):
+        """Notify once when a batch of tasks is scheduled"""
+        self.notification_manager.send_notification(
+            user_id,
+            "Tasks Scheduled",
+            f"Scheduled {count} tasks between {first_run} and {last_run}",
+            "info"
+        )
+    
     def notify_task_started(self, user_id, task_data):
         """Notify when a task starts"""
         self.notification_manager.send_notification(
@@ -242,7 +636,17 @@ class TaskNotificationHandler:
         )
     
     def notify_task_failed(self, user_id, task_data, error_message):
-        """Notify when a task fails"""
+        """Notify when a task fails; a burst of failures becomes one summary"""
+        def summarize(count, window):
+            self.notification_manager.send_notification(
+                user_id,
+                "Tasks Failing",
+                f"{count} tasks failed in {window / 60:.0f} min",
+                "error"
+            )
+        
+        if not self.notification_manager.suppressor.burst(f"task_failed:{user_id}", summarize):
+            return
         self.notification_manager.send_notification(
             user_id,
             "Task Failed",
@@ -259,35 +663,158 @@ class TaskNotificationHandler:
             "success" if completed_count == total_count else "warning"
         )
 
+# Named windows that alert rules can use as a 'time_window' condition
+ALERT_WINDOWS = {
+    'last_5_minutes': 300,
+    'last_15_minutes': 900,
+    'last_hour': 3600,
+    'last_day': 86400
+}
+DEFAULT_ALERT_WINDOW = 'last_hour'
+TASK_METRICS = ('task_failure_rate', 'task_count', 'task_duration_p95')
+BROWSER_METRICS = ('browser_connected', 'duration')
+
+class SlidingWindow:
+    """Task outcomes and durations over a trailing time window, updated incrementally"""
+    
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.events = deque()
+        self.failures = 0
+        # Kept sorted so percentiles are a single index lookup
+        self.durations = []
+    
+    def add(self, now, success, duration=None):
+        """Record one outcome"""
+        self.events.append((now, success, duration))
+        if not success:
+            self.failures += 1
+        if duration is not None:
+            bisect.insort(self.durations, duration)
+        self.trim(now)
+    
+    def trim(self, now):
+        """Drop outcomes that fell out of the window"""
+        while self.events and now - self.events[0][0] > self.seconds:
+            _, success, duration = self.events.popleft()
+            if not success:
+                self.failures -= 1
+            if duration is not None:
+                del self.durations[bisect.bisect_left(self.durations, duration)]
+    
+    def failure_rate(self):
+        """Share of outcomes in the window that failed"""
+        return self.failures / len(self.events) if self.events else 0.0
+    
+    def percentile(self, percent):
+        """Duration at the given percentile, or None without samples"""
+        if not self.durations:
+            return None
+        return self.durations[min(len(self.durations) - 1, int(len(self.durations) * percent / 100))]
+
 class AlertSystem:
-    """Advanced alert system for critical events"""
+    """Streaming alert engine that keeps windowed metrics and re-evaluates only the rules an event affects"""
     
-    def __init__(self, notification_manager):
+    def __init__(self, notification_manager, dispatcher=None):
         self.notification_manager = notification_manager
+        self.dispatcher = dispatcher or ActionDispatcher()
         self.alert_rules = []
+        # metric key -> rules whose conditions reference it
+        self.rule_index = {}
+        # window seconds -> SlidingWindow of task outcomes
+        self.windows = {}
+        self.gauges = {}
+        self.disconnected_since = None
+        self.lock = threading.Lock()
     
     def add_alert_rule(self, rule):
-        """Add an alert rule"""
-        self.alert_rules.append(rule)
+        """Add an alert rule and index it by the metrics it references"""
+        conditions = rule.get('conditions', {})
+        window = ALERT_WINDOWS.get(conditions.get('time_window', DEFAULT_ALERT_WINDOW), ALERT_WINDOWS[DEFAULT_ALERT_WINDOW])
+        compiled = dict(rule, window=window, keys=[key for key in conditions if key != 'time_window'])
+        
+        with self.lock:
+            self.alert_rules.append(compiled)
+            for key in compiled['keys']:
+                self.rule_index.setdefault(key, []).append(compiled)
+            if any(key in TASK_METRICS for key in compiled['keys']) and window not in self.windows:
+                self.windows[window] = SlidingWindow(window)
+    
+    def record_task(self, success, duration=None):
+        """Feed a finished task into the windowed task metrics"""
+        now = time.monotonic()
+        with self.lock:
+            for window in self.windows.values():
+                window.add(now, success, duration)
+        self._evaluate(TASK_METRICS)
+    
+    def record_browser(self, connected):
+        """Feed a browser connection check; disconnection duration grows while it stays down"""
+        with self.lock:
+            if connected:
+                self.disconnected_since = None
+            elif self.disconnected_since is None:
+                self.disconnected_since = time.monotonic()
+            self.gauges['browser_connected'] = connected
+        self._evaluate(BROWSER_METRICS)
     
     def check_alerts(self, event_data):
-        """Check if any alert rules are triggered"""
-        for rule in self.alert_rules:
+        """Feed point-in-time metric values (e.g. memory_usage, cpu_usage) and evaluate the rules using them"""
+        with self.lock:
+            self.gauges.update(event_data)
+        self._evaluate(event_data.keys())
+    
+    def _evaluate(self, changed_keys):
+        """Evaluate only the rules that reference a changed metric"""
+        with self.lock:
+            rules = {id(rule): rule for key in changed_keys for rule in self.rule_index.get(key, ())}
+            snapshots = [(rule, self._values(rule)) for rule in rules.values()]
+        
+        for rule, values in snapshots:
+            # A rule with a metric nobody has reported yet can neither fire nor clear
+            if values is None:
+                continue
             try:
-                if self._evaluate_rule(rule, event_data):
-                    self._trigger_alert(rule, event_data)
+                if self._evaluate_rule(rule, values):
+                    self._trigger_alert(rule, values)
+                else:
+                    self._resolve_alert(rule)
             except Exception as e:
                 print(f"Alert rule evaluation error: {e}")
     
-    def _evaluate_rule(self, rule, event_data):
-        """Evaluate if an alert rule matches the event"""
-        conditions = rule.get('conditions', {})
-        
-        for key, expected_value in conditions.items():
-            if key not in event_data:
-                return False
-            
-            actual_value = event_data[key]
+    def _values(self, rule):
+        """Current values of a rule's metrics, or None if any is unknown; call with the lock held"""
+        values = {}
+        for key in rule['keys']:
+            value = self._metric(key, rule['window'], rule.get('min_samples', 1))
+            if value is None:
+                return None
+            values[key] = value
+        return values
+    
+    def _metric(self, key, window_seconds, min_samples):
+        """Compute one metric; call with the lock held"""
+        if key in TASK_METRICS:
+            window = self.windows[window_seconds]
+            window.trim(time.monotonic())
+            if len(window.events) < min_samples:
+                return None
+            if key == 'task_failure_rate':
+                return window.failure_rate()
+            if key == 'task_count':
+                return len(window.events)
+            return window.percentile(95)
+        if key == 'duration':
+            if 'browser_connected' not in self.gauges:
+                return None
+            return time.monotonic() - self.disconnected_since if self.disconnected_since else 0
+        return self.gauges.get(key)
+    
+    def _evaluate_rule(self, rule, values):
+        """Evaluate if an alert rule matches the current metric values"""
+        for key in rule['keys']:
+            expected_value = rule['conditions'][key]
+            actual_value = values[key]
             
             if isinstance(expected_value, dict):
                 # Handle complex conditions
@@ -308,11 +835,16 @@ class AlertSystem:
         """Trigger an alert"""
         alert_config = rule.get('alert', {})
         
-        self.notification_manager.broadcast_notification(
+        # Repeats of an active alert are suppressed, along with their actions, until the cooldown passes
+        sent = self.notification_manager.send_alert(
+            f"rule:{rule.get('name')}",
             alert_config.get('title', 'System Alert'),
             alert_config.get('message', 'Alert condition triggered'),
-            alert_config.get('type', 'warning')
+            alert_config.get('type', 'warning'),
+            cooldown=rule.get('cooldown')
         )
+        if sent is None:
+            return
         
         # Execute any custom actions
         actions = rule.get('actions', [])
@@ -322,22 +854,16 @@ class AlertSystem:
             except Exception as e:
                 print(f"Alert action execution error: {e}")
     
+    def _resolve_alert(self, rule):
+        """Send a recovery notice once a triggered rule stops matching"""
+        title = rule.get('alert', {}).get('title', 'System Alert')
+        self.notification_manager.resolve_alert(
+            f"rule:{rule.get('name')}", f"{title} Resolved", f"{rule.get('name')} is no longer triggered"
+        )
+    
     def _execute_action(self, action, event_data):
-        """Execute a custom alert action"""
-        action_type = action.get('type')
-        
-        if action_type == 'email':
-            # Send email notification
-            pass
-        elif action_type == 'webhook':
-            # Send webhook
-            url = action.get('url')
-            if url:
-                requests.post(url, json=event_data, timeout=10)
-        elif action_type == 'log':
-            # Log to file
-            log_message = f"ALERT: {action.get('message', 'Alert triggered')} - {event_data}"
-            print(log_message)
+        """Hand a custom alert action to the background dispatcher"""
+        self.dispatcher.dispatch(action, event_data)
 
 # Default alert rules
 DEFAULT_ALERT_RULES = [
@@ -347,6 +873,7 @@ DEFAULT_ALERT_RULES = [
             'task_failure_rate': {'gt': 0.5},
             'time_window': 'last_hour'
         },
+        'min_samples': 4,
         'alert': {
             'title': 'High Task Failure Rate',
             'message': 'More than 50% of tasks have failed in the last hour',
@@ -26,7 +26,16 @@ class YiselWebApp {
     }
     
     initializeSocket() {
-        this.socket = io();
+        this.socket = io({
+            auth: { channels: ['notifications', 'tasks', 'jobs', 'system'] }
+        });
+        
+        // The server coalesces events into batch frames; hand each one to its normal handler
+        this.socket.on('batch', (data) => {
+            data.events.forEach(({ event, data: payload }) => {
+                this.socket.listeners(event).forEach((handler) => handler(payload));
+            });
+        });
         
         this.socket.on('connect', () => {
             console.log('Connected to server');
@@ -47,6 +56,21 @@ class YiselWebApp {
             this.refreshCurrentView();
         });
         
+        this.socket.on('harvest_completed', (data) => {
+            this.showNotification(`Visits refreshed for ${data.harvested} of ${data.total} patients`, data.failed ? 'warning' : 'success');
+            this.refreshCurrentView();
+        });
+        
+        this.socket.on('job_progress', (data) => {
+            if (data.kind !== 'fetch_patients') return;
+            if (data.status === 'completed') {
+                this.showNotification(`Fetched ${data.result.count} patients`, 'success');
+                this.refreshCurrentView();
+            } else if (data.status === 'failed') {
+                this.showNotification(`Patient fetch failed: ${data.error}`, 'error');
+            }
+        });
+        
         this.socket.on('low_battery_warning', (data) => {
             this.showNotification(`Low battery warning: ${data.level}%`, 'warning');
         });
@@ -444,12 +468,33 @@ class YiselWebApp {
     }
     
     async fetchPatients() {
-        this.showNotification('Fetching patients from Kinnser...', 'info');
-        // This would integrate with the actual patient fetching logic
-        // For now, just show a placeholder message
-        setTimeout(() => {
-            this.showNotification('Patient fetching feature coming soon', 'info');
-        }, 2000);
+        if (this.accounts.length === 0) {
+            await this.loadAccounts();
+        }
+        
+        const account = this.accounts[0];
+        if (!account) {
+            this.showNotification('Add an account before fetching patients', 'warning');
+            return;
+        }
+        
+        try {
+            const response = await fetch('/api/patients/fetch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ account_id: account.id })
+            });
+            const result = await response.json();
+            
+            if (result.success) {
+                this.showNotification('Fetching patients from Kinnser...', 'info');
+            } else {
+                this.showNotification(`Failed to fetch patients: ${result.error}`, 'error');
+            }
+        } catch (error) {
+            console.error('Failed to fetch patients:', error);
+            this.showNotification('Failed to fetch patients', 'error');
+        }
     }
     
     toggleTheme() {